@@ -1,21 +1,436 @@
+import os
 import warnings
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import geopandas as gpd
-import plotly.express as px
+from contextlib import nullcontext
+
 import streamlit as st
 
 warnings.filterwarnings("ignore")
 
 st.set_page_config(layout="wide")
 from streamlit_option_menu import option_menu
-from tqdm import tqdm
+
+from loader import derived, load_dataset, read_artifact, with_sentinels
+from partitions import map_partitions, related_partitions
+from queries import AlternativeCrit, CritMatrix, EntityCounts, FatalityRatio, TopGroups
+from search import facet_values, search
+from figcache import FIGURES, figure_json, figure_png
+from charts import clusterplot, countplot, densityplot, facetplot, geoplot, pieplot, ratioplot
+from instrument import capture, percentiles, records, rerun, set_section, span, traced
+
+
+def get_dataset():
+    dataset = load_dataset()
+    st.sidebar.caption(f"Dataset loaded cold in {dataset.cold_seconds:.3f}s"
+                       + (f", warm lookup {dataset.warm_seconds * 1000:.2f}ms" if dataset.warm_seconds else ""))
+    return dataset
+
+
+def query_frame(dataset, query):
+    """
+    Result of a query from queries.py as a DataFrame, recorded as the span "query.<name>"
+    """
+    with span("query." + query.name) as current:
+        frame = query.frame(dataset)
+        current.rows = len(frame)
+    return frame
+
+
+def show_pyplot(container, dataset, chart_id, params, render):
+    """
+    Draw a matplotlib/seaborn chart through the figure cache; render() only runs on a cache miss
+    """
+    png = FIGURES.get_or_render(("png", chart_id, params, dataset.version),
+                                traced("encode.png", rows=len)(lambda: figure_png(render())))
+    with span("display.image"):
+        container.image(png, width="stretch")
+
+
+def show_plotly(container, dataset, chart_id, params, render):
+    import plotly.io as pio
+
+    payload = FIGURES.get_or_render(("plotly", chart_id, params, dataset.version),
+                                    traced("encode.plotly", rows=len)(lambda: figure_json(render())))
+    with span("display.plotly"):
+        container.plotly_chart(pio.from_json(payload.decode("utf-8")), width="stretch")
+
+
+def select_widget(label, valuetup, key):
+    return st.selectbox(
+        label,
+        options=valuetup,
+        key=key
+    )
+
+
+def description_page():
+    st.markdown("<h1 style='text-align: left;'>Terrorism in South Asia</h1>", unsafe_allow_html=True)
+    st.markdown('''
+    <p style='text-align: justify;'>The analysis is based upon the <a href="https://www.start.umd.edu/gtd/">Global Terrorism Data(GTD)</a>, 
+    which is an event-level database consisting of more than 200,000 records of terrorist attacks which have plagued the world since 1970. 
+    In this mini-project, I have specifically visualized data for the South Asian region, which consists of Pakistan, India, Afghanistan, 
+    Sri Lanka, Bangladesh, Nepal, Maldives, Mauritius and Bhutan.</p>
+    ''', unsafe_allow_html=True)
+
+    with st.expander("Expanded view of the overall dataset👉"):
+        if st.checkbox("Show a preview of the dataset", key="Preview"):
+            dataset = get_dataset()
+            st.dataframe(with_sentinels(dataset.frame.head()))
+            st.table(derived(dataset, "describe", lambda ds: ds.frame.describe()))
+
+        if st.checkbox("Show the memory footprint per column", key="Memory"):
+            report = get_dataset().memory_report()
+            st.caption(f"{report['bytes'].sum() / 1e6:.1f} MB shared by all sessions")
+            st.dataframe(report)
+
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.markdown(''' 
+            <h3>Perpetrator(s)</h3>
+        <p>Captures information concerning terrorists</p>
+        <p>A brief description of parameters associated with this information is as follows:</p>
+        <ul> 
+               <li>gname - Perpetrator group name</li>
+               <li>nperpcap - This field records the number of perpetrators taken into custody</li>
+               <li>nperps - This field records the total number of terrorists participating in the incident</li>
+        </ul> 
+        <br>
+        <h3>Target(s)/Victim(s)</h3>
+        <p>Captures information concerning terrorist attack victims</p>
+        <p>A brief description of relevant target information is as follows:</p>
+        <ul> 
+               <li>targtype - Perpetrator group name</li>
+               <li>targsubtype - This field records the number of perpetrators taken into custody</li>
+               <li>corp - Name of corporate organization or government entity that was attacked</li>
+        </ul> 
+        <br> 
+        <h3>Incident Criteria</h3>
+        <p>Information with respect to conducted terrorist activity</p>
+        <p>A brief description of relevant incident information is as follows:</p>
+        <ul> 
+               <li>crit1 - Criteria to determine if an attack attack was aimed at achieving a particular political, economic, religious or social goal</li>
+               <li>crit2 - Criteria to determine if an attack was aimed to coerce, intimidate or publicize to larger audiences</li>
+               <li>crit3 - Criteria to determine if an attack was outside the precincts of international humanitarian law</li> 
+               <li>doubtterr - A binary label which encodes the "uncertainty" regarding the qualification of a terrorist attack</li>
+               <li>multiple - A binary label which encodes if the specific attack is part of a multiple co-ordinated attack</li>
+               <li>related - Lists GTD IDs of all other associated terrorist attacks, if it qualifies the "multiple" criterion</li>
+        </ul> 
+        <br>
+        <h3>Location Information</h3>
+        <p>Information concerning the location of terrorist attacks</p>
+        <p>A brief description of relevant location information is as follows:</p>
+        <ul> 
+               <li>country - Country where the terrorist attack took place </li>
+               <li>province - State/province of attack </li>
+               <li>city - City of attack </li>
+               <li>vicinity - Indicates if the attack took place in the vicinity of cities</li>
+               <li>latitude - Latitude of location where the attack took place</li>
+               <li>longitude - Longitude of location where the attack took place</li>
+               <li>geometry - Geometrical point co-ordinate where the attack occured</li>
+        </ul>
+        <br>
+        <h3>Event Date</h3>
+        <p>Information concerning when such attacks were conducted</p>
+        <p>A brief description of parameters associated with this information is as follows:</p>
+        <ul> 
+               <li>eventid - EventID </li>
+               <li>iyear - Year in which the attack took place</li>
+               <li>imonth - Month of attack</li>
+               <li>iday - Day of attack</li>
+               <li>imonth - Indicates if the attack spanned across multiple days</li>
+        </ul> 
+        <br>
+        <h3>Weapons</h3>
+            <p>Data on up to four types and sub-types of the weapons used in the attack are recorded for each case, in addition 
+            to any information on specific weapon details reported.</p>
+            <p>A brief description of parameters associated with this information is as follows:</p>
+            <ul> 
+                   <li>weaptype - Perpetrator group name</li>
+                   <li>weapsubtype - This field records the number of perpetrators taken into custody</li>
+        </ul> 
+        <br>
+        <h3>Casualties</h3>
+        <p>Information concerning loss of life and property as a result of terrorist attacks</p>
+        <p>A brief description of parameters associated with this information is as follows:</p>
+        <ul> 
+               <li>nkill - Count of victim fatalities</li>
+               <li>nkillter - Count of terrorist fatalities</li>
+               <li>nwound - Count of victims wounded in the attack</li>
+               <li>nwoundte - Count of terrorists wounded in the attack</li>
+               <li>property- If property damage has occured from the incident</li>
+               <li>ishostkid- Records whether or not the victims were taken hostage</li>        
+        </ul> 
+    
+    ''', unsafe_allow_html=True)
+
+
+def groups_section():
+    dataset = get_dataset()
+    st.markdown("<h3 style='text-align: center;'>Terrorist Group Involvement</h3>", unsafe_allow_html=True)
+    st.markdown("")
+    col1, col2 = st.columns([1.5, 2], gap="large")
+
+    with col1:
+        st.markdown('''
+        <p style='text-align: justify;'> The chart portrays the proportional representation of different terrorist organizations involved
+        in the attack. "Unknown" names refers to unrecognized or unidentified terror outfits. It is plausible that most of the terrorist 
+        attacks were not reported or documented by the governments and security agencies.</p>
+            ''', unsafe_allow_html=True)
+
+    with col2:
+        show_pyplot(st, dataset, "top_groups", (10,), lambda: pieplot(query_frame(dataset, TopGroups(10))))
+
+
+def entity_section():
+    dataset = get_dataset()
+    st.markdown("<h3 style='text-align: center;'>Entity Frequency Analysis</h3>", unsafe_allow_html=True)
+    st.markdown("")
+    col1f, col2f = st.columns([1.5, 2], gap="large")
+
+    with col1f:
+        selected_option = select_widget(
+            "Which attribute do you want to analyze?",
+            ("Target Type", "Alternative Attack Type", "Weapon", "Country"),
+            "Attribute"
+        )
+
+        if selected_option == "Target Type":
+            col1f.markdown(
+                "<p style='text-align: justify;'> Civilians were the major targets in most of the attacks, followed by police and military. </p>",
+                unsafe_allow_html=True)
+
+        elif selected_option == "Alternative Attack Type":
+            col1f.markdown(
+                "<p style='text-align: justify;'>Alternative attacks refer to unconfirmed violent acts which have not been confirmed as terrorist activities by governments and security agencies</p>",
+                unsafe_allow_html=True)
+            selected_criteria = select_widget("Inclusion criteria for doubtful terrorist attacks?",
+                                              ("Personal Motive", "Coercion and Intimidation",
+                                               "Illegitimate Warfare"),
+                                              "Criteria")
+
+            if selected_criteria == "Personal Motive":
+                col1f.markdown('''
+                    <p style='text-align: justify;'>The violent act must be aimed at attaining a political, economic or social goal. 
+                    This criterion is not satisfied in those cases where the perpetrator(s) acted out of a pure profit motive or from 
+                    an idiosyncratic personal motive unconnected with broader societal change</p>
+                    ''', unsafe_allow_html=True)
+
+            elif selected_criteria == "Coercion and Intimidation":
+                col1f.markdown('''
+                    <p style='text-align: justify;'col1fo satisfy this criterion there must be evidence of an intention to coerce, intimidate,
+                    or convey some other some other message to a larger audience (or audiences) than the immediate victims. Such evidence 
+                    can include (but is not limited to) the following: pre- or post-attack statements by the perpetrator(s), past behavior by the perpetrators, 
+                    or the particular nature of the target/victim, weapon, or attack type
+                    ''', unsafe_allow_html=True)
+
+            else:
+                col1f.markdown('''
+                   <p style='text-align: justify;'>The action is outside the context of legitimate warfare activities, insofar as it targets          
+                   non-combatants, i.e., the act must be outside the parameters permitted by international humanitarian law as reflected in the 
+                   Additional Protocol to the Geneva Conventions of 12 August 1949 and elsewhere</p>
+                   ''', unsafe_allow_html=True)
+
+        elif selected_option == "Weapon":
+            col1f.markdown(
+                "<p>Explosives and firearms were used a lot more than any other weapon in carrying out terrorist activities</p>",
+                unsafe_allow_html=True)
+
+        else:
+            col1f.markdown("<p>Afghanistan has witnessed significantly more attacks than any other country</p>",
+                           unsafe_allow_html=True)
+
+    with col2f:
+        if selected_option == "Target Type":
+            show_pyplot(col2f, dataset, "countplot", ("targettype", None),
+                        lambda: countplot(query_frame(dataset, EntityCounts("targettype")), "targettype", None))
+
+        elif selected_option == "Alternative Attack Type":
+            criteria = "crit1"
+            if selected_criteria == "Coercion and Intimidation":
+                criteria = "crit2"
+            elif selected_criteria == "Illegitimate Warfare":
+                criteria = "crit3"
+            show_pyplot(col2f, dataset, "countplot", ("alternative_attack_type", criteria),
+                        lambda: countplot(query_frame(dataset, AlternativeCrit(criteria)), "alternative_attack_type",
+                                          criteria))
+
+        elif selected_option == "Weapon":
+            show_pyplot(col2f, dataset, "countplot", ("weaptype", None),
+                        lambda: countplot(query_frame(dataset, EntityCounts("weaptype")), "weaptype", None))
+
+        else:
+            show_pyplot(col2f, dataset, "countplot", ("country", None),
+                        lambda: countplot(query_frame(dataset, EntityCounts("country")), "country", None))
+
+
+def militant_section():
+    dataset = get_dataset()
+    st.markdown("<h3 style='text-align: center;'>Terrorist Activities vs. other Militant Attacks</h3>",
+                unsafe_allow_html=True)
+    st.markdown("")
+    col1c, col2c = st.columns([1, 1], gap="large")
+
+    with col1c:
+        show_pyplot(st, dataset, "crit_facets", ("terr",),
+                    lambda: facetplot(query_frame(dataset, CritMatrix(terrorism=True))))
+        st.markdown('''
+        <p style='text-align: justify;'>It is confirmed that not only all terrorists have a personal agenda, but they also have a proclivity 
+        for intimidating people through horrendous and inhuman methods</p>
+        ''', unsafe_allow_html=True)
+
+    with col2c:
+        show_pyplot(st, dataset, "crit_facets", ("notterr",),
+                    lambda: facetplot(query_frame(dataset, CritMatrix(terrorism=False))))
+        st.markdown('''
+        <p style='text-align: justify;'>Other unreported militant activities flout humanitarian laws, but their agenda or motivation cannot
+        be perfectly established</p>
+        ''', unsafe_allow_html=True)
+
+
+def ratio_section():
+    dataset = get_dataset()
+
+    st.markdown("<h4 style='text-align: center;'></h4>", unsafe_allow_html=True)
+    st.write("")
+    show_plotly(st, dataset, "kill_ratio", (), lambda: ratioplot(query_frame(dataset, FatalityRatio())))
+    st.markdown('''
+    <p style='text-align: justify;'><b>Click on different country names in the legend to hide their representation in the plot.</b>
+    We can infer that significantly larger number of terrorist attacks have been perpetrated during the time period from 2007-2017, 
+    particularly in Afghanistan, Pakistan and India. Moreover, the period witnessed higher number of fatalities during this period.</p>
+    ''', unsafe_allow_html=True)
+
+
+def related_section():
+    dataset = get_dataset()
+    geo_rel_partitions = related_partitions(dataset)
+    st.markdown("<h3 style='text-align: center;'>Civilian Deaths in Terrorist Attacks</h3>",
+                unsafe_allow_html=True)
+
+    st.markdown("")
+
+    col1d, col2d = st.columns([1, 1], gap="large")
+
+    with col1d:
+        country_select = select_widget(
+            "Select Country",
+            ("India", "Afghanistan", "Pakistan", "Bangladesh", "Sri Lanka", "Bhutan", "Maldives", "Nepal"),
+            "Country1"
+        )
+
+    with col2d:
+        year_select = select_widget(
+            "Select Year",
+            tuple(geo_rel_partitions.years_for(country_select)),
+            "Year1"
+        )
+
+    show_plotly(st, dataset, "densityplot", (country_select, year_select),
+                lambda: densityplot(geo_rel_partitions, country_select, year_select, "casualties"))
+
+
+def weapon_section():
+    dataset = get_dataset()
+    geo_partitions = map_partitions(dataset)
+    st.markdown("<h3 style='text-align: center;'>Weapon Category across Countries</h3>",
+                unsafe_allow_html=True)
+    st.markdown("")
+
+    col1e, col2e = st.columns([1, 1], gap="large")
+
+    with col1e:
+        country_weapon_select = select_widget(
+            "Select Country",
+            ("India", "Afghanistan", "Pakistan", "Bangladesh", "Sri Lanka", "Bhutan", "Maldives", "Nepal"),
+            "Country2"
+        )
+
+    with col2e:
+        country_year_select = select_widget(
+            "Select Year",
+            tuple(geo_partitions.years_for(country_weapon_select)),
+            "Year2"
+        )
+
+        show_plotly(st, dataset, "geoplot", (country_weapon_select, country_year_select),
+                    lambda: geoplot(geo_partitions, country_weapon_select, country_year_select, "attacktype"))
+
+
+def clusters_section():
+    dataset = get_dataset()
+    st.markdown("<h3 style='text-align: center;'>Attack Location Clusters</h3>", unsafe_allow_html=True)
+    st.markdown("")
+
+    clusters = read_artifact(dataset, "clusters")
+    if clusters is None:
+        st.info("No clustering results for this dataset yet. Run `python deploy/clustering.py` to compute them.")
+    else:
+        algorithm_select = select_widget("Select Algorithm", tuple(clusters.columns[1:]), "Algorithm")
+        show_plotly(st, dataset, "clusterplot", (algorithm_select,),
+                    lambda: clusterplot(map_partitions(dataset).frame, clusters, algorithm_select))
+
+
+def search_section():
+    dataset = get_dataset()
+    st.markdown("<h3 style='text-align: center;'>Search</h3>", unsafe_allow_html=True)
+    text = st.text_input("Search perpetrators, targets, weapons and places", key="SearchText",
+                         placeholder="e.g. taliban police, gname:lashkar* OR gname:jaish*, -explosives")
+    options = facet_values(dataset)
+    col1, col2, col3 = st.columns(3)
+    countries = col1.multiselect("Country", options["country"], key="SearchCountry")
+    years = col2.multiselect("Year", options["iyear"], key="SearchYear")
+    attacks = col3.multiselect("Attack type", options["attacktype"], key="SearchAttack")
+
+    result = search(dataset, text, 100, country=countries, iyear=years, attacktype=attacks)
+    st.caption(f"{result.total} matching attacks in {result.seconds * 1000:.1f} ms"
+               + (", showing the first 100" if result.total > 100 else ""))
+    st.dataframe(result.hits, hide_index=True, width="stretch")
+    for column, counts in zip(st.columns(len(result.facets)), result.facets.values()):
+        column.dataframe(counts.head(15), hide_index=True, width="stretch")
+
+
+# Every section prepares its own data, and only the selected one runs on a rerun
+SECTIONS = {
+    "Terrorist Groups": groups_section,
+    "Entity Frequency": entity_section,
+    "Terrorist vs. Militant Attacks": militant_section,
+    "Fatality-Casualty Ratio": ratio_section,
+    "Civilian Deaths": related_section,
+    "Weapon Categories": weapon_section,
+    "Location Clusters": clusters_section,
+    "Search": search_section,
+}
+
+
+def analysis_page():
+    st.markdown("<h1 style='text-align: center;'>Data Analysis</h1>", unsafe_allow_html=True)
+    st.markdown("")
+    section = st.radio("Section", tuple(SECTIONS), horizontal=True, key="Section", label_visibility="collapsed")
+    st.markdown("<br>", unsafe_allow_html=True)
+    set_section(section)
+    with span("section"):
+        SECTIONS[section]()
+
+
+def admin_enabled():
+    return os.environ.get("DASHBOARD_ADMIN") == "1" or st.query_params.get("admin") == "1"
+
+
+def admin_panel():
+    """
+    Latency percentiles of recent reruns and a one-rerun profiler, shown with DASHBOARD_ADMIN=1 or ?admin=1
+    """
+    with st.sidebar.expander("Performance"):
+        recent = records()
+        st.caption(f"{recent['run_id'].nunique()} recent reruns")
+        st.dataframe(percentiles(recent[recent["span"] == "rerun"], by=("section",)), hide_index=True)
+        st.dataframe(percentiles(recent[recent["span"] != "rerun"]), hide_index=True)
+
+        st.selectbox("Profiler", ("cprofile", "tracemalloc"), key="ProfileMode")
+        st.button("Profile the next rerun", key="Profile",
+                  on_click=lambda: st.session_state.update(ProfileNext=st.session_state["ProfileMode"]))
+        if st.session_state.get("ProfileReport"):
+            st.code(st.session_state["ProfileReport"])
 
 
 def main():
-    terr_data = pd.read_csv("data/combined_data.csv")
     with st.sidebar:
         choose = option_menu("Welcome", ["Description", "Exploratory Analysis", "Code"],
                              icons=['table', 'bar-chart', 'cpu'],
@@ -28,391 +443,23 @@ def main():
                                  "nav-link-selected": {"background-color": "#4d4d4d"},
                              })
 
-    if choose == "Description":
-        st.markdown("<h1 style='text-align: left;'>Terrorism in South Asia</h1>", unsafe_allow_html=True)
-        st.markdown('''
-        <p style='text-align: justify;'>The analysis is based upon the <a href="https://www.start.umd.edu/gtd/">Global Terrorism Data(GTD)</a>, 
-        which is an event-level database consisting of more than 200,000 records of terrorist attacks which have plagued the world since 1970. 
-        In this mini-project, I have specifically visualized data for the South Asian region, which consists of Pakistan, India, Afghanistan, 
-        Sri Lanka, Bangladesh, Nepal, Maldives, Mauritius and Bhutan.</p>
-        ''', unsafe_allow_html=True)
-
-        with st.expander("Expanded view of the overall dataset👉"):
-            st.dataframe(terr_data.head())
-            st.table(terr_data.describe())
-
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown(''' 
-                <h3>Perpetrator(s)</h3>
-            <p>Captures information concerning terrorists</p>
-            <p>A brief description of parameters associated with this information is as follows:</p>
-            <ul> 
-                   <li>gname - Perpetrator group name</li>
-                   <li>nperpcap - This field records the number of perpetrators taken into custody</li>
-                   <li>nperps - This field records the total number of terrorists participating in the incident</li>
-            </ul> 
-            <br>
-            <h3>Target(s)/Victim(s)</h3>
-            <p>Captures information concerning terrorist attack victims</p>
-            <p>A brief description of relevant target information is as follows:</p>
-            <ul> 
-                   <li>targtype - Perpetrator group name</li>
-                   <li>targsubtype - This field records the number of perpetrators taken into custody</li>
-                   <li>corp - Name of corporate organization or government entity that was attacked</li>
-            </ul> 
-            <br> 
-            <h3>Incident Criteria</h3>
-            <p>Information with respect to conducted terrorist activity</p>
-            <p>A brief description of relevant incident information is as follows:</p>
-            <ul> 
-                   <li>crit1 - Criteria to determine if an attack attack was aimed at achieving a particular political, economic, religious or social goal</li>
-                   <li>crit2 - Criteria to determine if an attack was aimed to coerce, intimidate or publicize to larger audiences</li>
-                   <li>crit3 - Criteria to determine if an attack was outside the precincts of international humanitarian law</li> 
-                   <li>doubtterr - A binary label which encodes the "uncertainty" regarding the qualification of a terrorist attack</li>
-                   <li>multiple - A binary label which encodes if the specific attack is part of a multiple co-ordinated attack</li>
-                   <li>related - Lists GTD IDs of all other associated terrorist attacks, if it qualifies the "multiple" criterion</li>
-            </ul> 
-            <br>
-            <h3>Location Information</h3>
-            <p>Information concerning the location of terrorist attacks</p>
-            <p>A brief description of relevant location information is as follows:</p>
-            <ul> 
-                   <li>country - Country where the terrorist attack took place </li>
-                   <li>province - State/province of attack </li>
-                   <li>city - City of attack </li>
-                   <li>vicinity - Indicates if the attack took place in the vicinity of cities</li>
-                   <li>latitude - Latitude of location where the attack took place</li>
-                   <li>longitude - Longitude of location where the attack took place</li>
-                   <li>geometry - Geometrical point co-ordinate where the attack occured</li>
-            </ul>
-            <br>
-            <h3>Event Date</h3>
-            <p>Information concerning when such attacks were conducted</p>
-            <p>A brief description of parameters associated with this information is as follows:</p>
-            <ul> 
-                   <li>eventid - EventID </li>
-                   <li>iyear - Year in which the attack took place</li>
-                   <li>imonth - Month of attack</li>
-                   <li>iday - Day of attack</li>
-                   <li>imonth - Indicates if the attack spanned across multiple days</li>
-            </ul> 
-            <br>
-            <h3>Weapons</h3>
-                <p>Data on up to four types and sub-types of the weapons used in the attack are recorded for each case, in addition 
-                to any information on specific weapon details reported.</p>
-                <p>A brief description of parameters associated with this information is as follows:</p>
-                <ul> 
-                       <li>weaptype - Perpetrator group name</li>
-                       <li>weapsubtype - This field records the number of perpetrators taken into custody</li>
-            </ul> 
-            <br>
-            <h3>Casualties</h3>
-            <p>Information concerning loss of life and property as a result of terrorist attacks</p>
-            <p>A brief description of parameters associated with this information is as follows:</p>
-            <ul> 
-                   <li>nkill - Count of victim fatalities</li>
-                   <li>nkillter - Count of terrorist fatalities</li>
-                   <li>nwound - Count of victims wounded in the attack</li>
-                   <li>nwoundte - Count of terrorists wounded in the attack</li>
-                   <li>property- If property damage has occured from the incident</li>
-                   <li>ishostkid- Records whether or not the victims were taken hostage</li>        
-            </ul> 
-        
-        ''', unsafe_allow_html=True)
-
-    elif choose == "Exploratory Analysis":
-
-
-        def select_widget(label, valuetup, key):
-            return st.selectbox(
-                label,
-                options=valuetup,
-                key=key
-            )
-
-
-        def set_labels(ax, xlabel, ylabel, x_fontsize, y_fontsize):
-            ax.set_xlabel(xlabel, fontsize=x_fontsize, labelpad=15)
-            ax.set_ylabel(ylabel, fontsize=y_fontsize, labelpad=14)
-
-
-        def countplot(df, parameter, criteria):
-            fig = plt.figure(figsize=(7, 5))
-
-            if parameter == "targettype" and criteria is None:
-                ax = sns.countplot(data=df, y=parameter)
-                set_labels(ax, "Count", "Target Type", 13, 13)
-                return fig
-
-            elif parameter == "weaptype" and criteria is None:
-                ax = sns.countplot(y=parameter, data=df, palette=["tomato"])
-                set_labels(ax, "Count", "Attack Weapon", x_fontsize=10, y_fontsize=10)
-                return fig
-
-            elif parameter == "country" and criteria is None:
-                ax = sns.countplot(y=parameter, data=df, palette="pastel")
-                set_labels(ax, "Count", "Country Of Attack", x_fontsize=10, y_fontsize=10)
-                return fig
-
-            elif parameter == "alternative_attack_type" and criteria is not None:
-                title_text = "Political, Economic or Religious Goal"
-                if criteria == "crit2":
-                    title_text = "Coercion and Intimidation"
-                elif criteria == "crit3":
-                    title_text = "Illegitimate Warfare"
-                ax = sns.countplot(data=df, y=parameter, hue=criteria,
-                                   palette=["tomato", "limegreen"])
-                set_labels(ax, "Count", "Alternative Attack Type", x_fontsize=10, y_fontsize=10)
-                ax.legend(title=title_text, loc="lower right", labels=["No", "Yes"])
-                return fig
-
-
-        def densityplot(geo_df, country, year, color_hue):
-            geo_df = geo_df[(geo_df["country"] == country) & (geo_df["iyear"] == year)]
-            fig = px.scatter_mapbox(geo_df, lat="latitude", lon="longitude", size=color_hue,
-                                    hover_name="tooltip_text", hover_data=["latitude", "longitude"],
-                                    mapbox_style="open-street-map", width=1500)
-            return fig
-
-
-        def geoplot(geo_df, country, year, color_hue):
-            geo_df = geo_df[(geo_df["country"] == country) & (geo_df["iyear"] == year)]
-            fig = px.scatter_geo(geo_df, lat=geo_df["geometry"].x, lon=geo_df["geometry"].y, hover_name="tooltip_text",
-                                 color=color_hue, size="casualties", scope="asia", projection="natural earth",
-                                 width=1500)
-
-            # Reset the legend title
-            fig.update_layout(legend=dict(title="Attack Type"))
-            return fig
-
-        st.markdown("<h1 style='text-align: center;'>Data Analysis</h1>", unsafe_allow_html=True)
-        st.markdown("")
-        st.markdown("<h3 style='text-align: center;'>Terrorist Group Involvement</h3>", unsafe_allow_html=True)
-        st.markdown("")
-        col1, col2 = st.columns([1.5, 2], gap="large")
-
-        with col1:
-            st.markdown('''
-            <p style='text-align: justify;'> The chart portrays the proportional representation of different terrorist organizations involved
-            in the attack. "Unknown" names refers to unrecognized or unidentified terror outfits. It is plausible that most of the terrorist 
-            attacks were not reported or documented by the governments and security agencies.</p>
-                ''', unsafe_allow_html=True)
-
-        with col2:
-            def my_autopct(pct):
-                return ("%.2f%%" % pct) if pct > 10 else ""
-
-            top_perp_info = terr_data["gname"].value_counts().sort_values(ascending=False).head(10).to_dict()
-            df_perp_info = pd.DataFrame(data=top_perp_info.values(), index=top_perp_info.keys(),
-                                        columns=["Attack_count"])
-            labels = df_perp_info.index
-            values = df_perp_info["Attack_count"]
-            fig, ax = plt.subplots(figsize=(18, 14), subplot_kw=dict(aspect="equal"))
-            myexplode = [0.05, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-            ax.pie(values, shadow=True, startangle=90, autopct=my_autopct, pctdistance=0.6, explode=myexplode,
-                   textprops={"fontsize": 20})
-            ax.axis("equal")
-            ax.legend(labels, loc='upper right', bbox_to_anchor=(1.3, 0.9), fontsize=15)
-            st.pyplot(fig)
-
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown("<h3 style='text-align: center;'>Entity Frequency Analysis</h3>", unsafe_allow_html=True)
-            st.markdown("")
-
-            df_terr = terr_data[terr_data["doubtterr"] == 0]
-            df_notterr = terr_data[terr_data["doubtterr"] != 0]
-
-        col1f, col2f = st.columns([1.5, 2], gap="large")
-
-        with col1f:
-            selected_option = select_widget(
-                "Which attribute do you want to analyze?",
-                ("Target Type", "Alternative Attack Type", "Weapon", "Country"),
-                "Attribute"
-            )
-
-            if selected_option == "Target Type":
-                col1f.markdown(
-                    "<p style='text-align: justify;'> Civilians were the major targets in most of the attacks, followed by police and military. </p>",
-                    unsafe_allow_html=True)
-
-            elif selected_option == "Alternative Attack Type":
-                col1f.markdown(
-                    "<p style='text-align: justify;'>Alternative attacks refer to unconfirmed violent acts which have not been confirmed as terrorist activities by governments and security agencies</p>",
-                    unsafe_allow_html=True)
-                selected_criteria = select_widget("Inclusion criteria for doubtful terrorist attacks?",
-                                                  ("Personal Motive", "Coercion and Intimidation",
-                                                   "Illegitimate Warfare"))
-
-                if selected_criteria == "Personal Motive":
-                    col1f.markdown('''
-                        <p style='text-align: justify;'>The violent act must be aimed at attaining a political, economic or social goal. 
-                        This criterion is not satisfied in those cases where the perpetrator(s) acted out of a pure profit motive or from 
-                        an idiosyncratic personal motive unconnected with broader societal change</p>
-                        ''', unsafe_allow_html=True)
-
-                elif selected_criteria == "Coercion and Intimidation":
-                    col1f.markdown('''
-                        <p style='text-align: justify;'col1fo satisfy this criterion there must be evidence of an intention to coerce, intimidate,
-                        or convey some other some other message to a larger audience (or audiences) than the immediate victims. Such evidence 
-                        can include (but is not limited to) the following: pre- or post-attack statements by the perpetrator(s), past behavior by the perpetrators, 
-                        or the particular nature of the target/victim, weapon, or attack type
-                        ''', unsafe_allow_html=True)
-
-                else:
-                    col1f.markdown('''
-                       <p style='text-align: justify;'>The action is outside the context of legitimate warfare activities, insofar as it targets          
-                       non-combatants, i.e., the act must be outside the parameters permitted by international humanitarian law as reflected in the 
-                       Additional Protocol to the Geneva Conventions of 12 August 1949 and elsewhere</p>
-                       ''', unsafe_allow_html=True)
-
-            elif selected_option == "Weapon":
-                col1f.markdown(
-                    "<p>Explosives and firearms were used a lot more than any other weapon in carrying out terrorist activities</p>",
-                    unsafe_allow_html=True)
-
-            else:
-                col1f.markdown("<p>Afghanistan has witnessed significantly more attacks than any other country</p>",
-                               unsafe_allow_html=True)
-
-        with col2f:
-            if selected_option == "Target Type":
-                col2f.pyplot(countplot(terr_data, "targettype", None))
-
-            elif selected_option == "Alternative Attack Type":
-                if selected_criteria == "Personal Motive":
-                    col2f.pyplot(countplot(df_notterr, "alternative_attack_type", "crit1"))
-
-                elif selected_criteria == "Coercion and Intimidation":
-                    col2f.pyplot(countplot(df_notterr, "alternative_attack_type", "crit2"))
-
-                else:
-                    col2f.pyplot(countplot(df_notterr, "alternative_attack_type", "crit3"))
-
-            elif selected_option == "Weapon":
-                col2f.pyplot(countplot(df_notterr, "weaptype", None))
-
-            else:
-                col2f.pyplot(countplot(df_notterr, "country", None))
-
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("<h3 style='text-align: center;'>Terrorist Activities vs. other Militant Attacks</h3>",
-                    unsafe_allow_html=True)
-        st.markdown("")
-        col1c, col2c = st.columns([1, 1], gap="large")
-
-        with col1c:
-            g = sns.FacetGrid(df_terr, col="crit3", row="crit2")
-            g.map(sns.countplot, "crit1")
-            st.pyplot(g)
-            st.markdown('''
-            <p style='text-align: justify;'>It is confirmed that not only all terrorists have a personal agenda, but they also have a proclivity 
-            for intimidating people through horrendous and inhuman methods</p>
-            ''', unsafe_allow_html=True)
-
-        with col2c:
-            g1 = sns.FacetGrid(df_notterr, col="crit3", row="crit2")
-            g1.map(sns.countplot, "crit1")
-            st.pyplot(g1)
-            st.markdown('''
-            <p style='text-align: justify;'>Other unreported militant activities flout humanitarian laws, but their agenda or motivation cannot
-            be perfectly established</p>
-            ''', unsafe_allow_html=True)
-
-        st.markdown("")
-
-        st.markdown("<h4 style='text-align: center;'></h4>", unsafe_allow_html=True)
-        st.write("")
-        year_kills = pd.DataFrame(terr_data.groupby(["iyear", "country"])["success"].count().reset_index())
-        year_kills = year_kills.loc[:, ~year_kills.columns.duplicated()]
-        year_kills["kills"] = terr_data.groupby(["iyear", "country"])["nkill"].sum().values
-        year_kills["wounded"] = terr_data.groupby(["iyear", "country"])["nwound"].sum().values
-        year_kills["kill_ratio"] = np.round(((year_kills["kills"]) / (year_kills["kills"] + year_kills["wounded"] + 1)),
-                                            3)
-        fig_scatter = px.scatter(year_kills, x="iyear", y="kill_ratio", color="country", size="success")
-        fig_scatter.update_layout(title="Fatality-Casualty Ratio", title_x=1)
-        st.plotly_chart(fig_scatter, use_container_width=True)
-        st.markdown('''
-        <p style='text-align: justify;'><b>Click on different country names in the legend to hide their representation in the plot.</b>
-        We can infer that significantly larger number of terrorist attacks have been perpetrated during the time period from 2007-2017, 
-        particularly in Afghanistan, Pakistan and India. Moreover, the period witnessed higher number of fatalities during this period.</p>
-        ''', unsafe_allow_html=True)
-
-        st.markdown("<br>", unsafe_allow_html=True)
-
-        st.markdown("<h3 style='text-align: center;'>Civilian Deaths in Terrorist Attacks</h3>",
-                    unsafe_allow_html=True)
-
-        st.markdown("")
-        rel_attacks_ls = []
-        geo_data = gpd.GeoDataFrame(terr_data, geometry=gpd.points_from_xy(terr_data["latitude"],
-                                                                           terr_data["longitude"]))
-        geo_data = geo_data.loc[:, ~geo_data.columns.duplicated()]
-        geo_data = geo_data[
-            ["latitude", "longitude", "geometry", "city", "country", "casualties", "attacktype", "eventid", "iyear",
-             "related"]]
-        geo_data["tooltip_text"] = geo_data["city"] + ", " + geo_data["country"]
-        geo_data_rel = geo_data[geo_data["related"] != "Unknown"]
-        geo_data_rel = geo_data_rel.reset_index()
-        geo_data_rel = geo_data_rel.drop("index", axis=1)
-        for idx in tqdm(geo_data_rel.index):
-            rel_ls = list(geo_data_rel.loc[idx, "related"].split(","))
-            rel_ls.append(str(geo_data_rel.loc[idx, "eventid"]))
-            rel_ls.sort()
-            if rel_ls not in rel_attacks_ls:
-                rel_attacks_ls.append(rel_ls)
-
-        def append_event_id(row):
-            rel_ls = row["related"].split(",")
-            rel_ls.append(str(row["eventid"]))
-            rel_ls.sort()
-            return rel_ls
-
-        geo_data_rel["events"] = geo_data_rel.apply(lambda rowval: append_event_id(rowval), axis=1)
-        geo_data_rel["event_key"] = geo_data_rel["events"].apply(lambda val: rel_attacks_ls.index(val))
-        geo_data_rel["event_key"] = geo_data_rel["event_key"].astype("int64")
-
-        col1d, col2d = st.columns([1, 1], gap="large")
-
-        with col1d:
-            country_select = select_widget(
-                "Select Country",
-                ("India", "Afghanistan", "Pakistan", "Bangladesh", "Sri Lanka", "Bhutan", "Maldives", "Nepal"),
-                "Country1"
-            )
-
-        with col2d:
-            year_select = select_widget(
-                "Select Year",
-                tuple(geo_data_rel["iyear"].unique()),
-                "Year1"
-            )
-
-        st.plotly_chart(densityplot(geo_data_rel, country_select, year_select, "casualties"), use_container_width=True)
-
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("<h3 style='text-align: center;'>Weapon Category across Countries</h3>",
-                    unsafe_allow_html=True)
-        st.markdown("")
-
-        col1e, col2e = st.columns([1, 1], gap="large")
-
-        with col1e:
-            country_weapon_select = select_widget(
-                "Select Country",
-                ("India", "Afghanistan", "Pakistan", "Bangladesh", "Sri Lanka", "Bhutan", "Maldives", "Nepal"),
-                "Country2"
-            )
-
-        with col2e:
-            country_year_select = select_widget(
-                "Select Year",
-                tuple(geo_data_rel["iyear"].unique()),
-                "Year2"
-            )
-
-            st.plotly_chart(geoplot(geo_data, country_weapon_select, country_year_select, "attacktype"),
-                            use_container_width=True)
+    admin = admin_enabled()
+    # Set by the "Profile the next rerun" button, whose click triggers this rerun
+    mode = st.session_state.pop("ProfileNext", None) if admin else None
+    with rerun(choose), (capture(mode) if mode else nullcontext()) as captured:
+        if choose == "Description":
+            description_page()
+
+        elif choose == "Exploratory Analysis":
+            analysis_page()
+    if captured is not None:
+        st.session_state["ProfileReport"] = captured.report
+
+    stats = FIGURES.stats()
+    st.sidebar.caption(f"Figure cache: {stats['hits'] + stats['disk_hits']} hits, {stats['misses']} misses, "
+                       f"{stats['entries']} entries ({stats['bytes'] / 1e6:.1f} MB)")
+    if admin:
+        admin_panel()
 
 
 if __name__ == "__main__":
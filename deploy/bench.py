@@ -0,0 +1,311 @@
+"""
+Benchmarks of every pipeline stage on synthetic data (see synth.py) at several sizes.
+
+After a warm-up run, each stage is run once under tracemalloc for its peak allocation and then timed (best of
+--repeat runs). Results can be stored as a baseline and later runs compared against it; a stage slower or larger
+than the baseline by more than --tolerance is reported as a regression and makes the command exit with status 1:
+
+    python deploy/bench.py --rows 10000 100000 1000000 --save benchmarks/baseline.json
+    python deploy/bench.py --rows 10000 100000 1000000 --compare benchmarks/baseline.json
+
+Baselines are only comparable on the machine (and with the library versions) they were recorded with; the one in
+benchmarks/baseline.json is a reference for the relative cost of the stages, recorded with the environment stored in
+it.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import loader
+from cube import Cube, build_cube, build_group_counts
+from partitions import PartitionIndex, build_map_frame
+from related import group_related
+from synth import generate
+
+ROWS = [10000, 100000, 1000000]
+DEFAULT_TOLERANCE = 0.25
+
+
+class Context:
+    """
+    Synthetic dataset of one size and the intermediate results stages depend on, built outside the measurements
+    """
+
+    def __init__(self, rows, work_dir):
+        self.rows = rows
+        self.path = os.path.join(work_dir, f"synthetic_{rows}.csv")
+        generate(rows).to_csv(self.path, index=False)
+        self._values = {}
+
+    def _memo(self, name, build):
+        if name not in self._values:
+            self._values[name] = build()
+        return self._values[name]
+
+    def dataset(self):
+        return self._memo("dataset", lambda: loader.load_dataset(self.path))
+
+    def cube(self):
+        frame = self.dataset().frame
+        return self._memo("cube", lambda: Cube(build_cube(frame), build_group_counts(frame)))
+
+    def partitions(self):
+        return self._memo("partitions", lambda: PartitionIndex(build_map_frame(self.dataset().frame)))
+
+    def largest_partition(self):
+        offsets = self.partitions().offsets
+        return max(offsets, key=lambda key: offsets[key][1] - offsets[key][0])
+
+    def remove_snapshots(self):
+        loader.clear_cache()
+        stem, _ = os.path.splitext(self.path)
+        for suffix in (".parquet", ".pkl", ".manifest.json"):
+            if os.path.exists(stem + suffix):
+                os.remove(stem + suffix)
+
+
+# Every stage takes the Context, does its setup and returns the zero-argument callable that is measured
+
+def csv_load(ctx):
+    def run():
+        ctx.remove_snapshots()
+        loader.load_dataset(ctx.path)
+    return run
+
+
+def snapshot_load(ctx):
+    ctx.dataset()
+
+    def run():
+        loader.clear_cache()
+        loader.load_dataset(ctx.path)
+    return run
+
+
+def cube_build(ctx):
+    frame = ctx.dataset().frame
+    return lambda: (build_cube(frame), build_group_counts(frame))
+
+
+def year_kills(ctx):
+    return ctx.cube().year_kills
+
+
+def map_frame(ctx):
+    # Replaces the GeoDataFrame the dashboard used to build for its maps
+    frame = ctx.dataset().frame
+    return lambda: PartitionIndex(build_map_frame(frame))
+
+
+def related_grouping(ctx):
+    frame = ctx.dataset().frame
+    return lambda: group_related(frame)
+
+
+def partition_filter(ctx):
+    partitions = ctx.partitions()
+
+    def run():
+        for country in partitions.countries():
+            for year in partitions.years_for(country):
+                partitions.get(country, year)
+    return run
+
+
+def _chart(render, encode):
+    return lambda: encode(render())
+
+
+def chart_countplot(ctx):
+    from charts import countplot
+    from figcache import figure_png
+
+    cube = ctx.cube()
+    return _chart(lambda: countplot(cube.rollup("targettype"), "targettype", None), figure_png)
+
+
+def chart_pieplot(ctx):
+    from charts import pieplot
+    from figcache import figure_png
+
+    cube = ctx.cube()
+    return _chart(lambda: pieplot(cube.top_groups(10)), figure_png)
+
+
+def chart_facetplot(ctx):
+    from charts import facetplot
+    from figcache import figure_png
+
+    cube = ctx.cube()
+    return _chart(lambda: facetplot(cube.rollup(["crit1", "crit2", "crit3"], doubtterr=0)), figure_png)
+
+
+def chart_ratioplot(ctx):
+    from charts import ratioplot
+    from figcache import figure_json
+
+    cube = ctx.cube()
+    return _chart(lambda: ratioplot(cube.year_kills()), figure_json)
+
+
+def chart_densityplot(ctx):
+    from charts import densityplot
+    from figcache import figure_json
+
+    partitions, (country, year) = ctx.partitions(), ctx.largest_partition()
+    return _chart(lambda: densityplot(partitions, country, year, "casualties"), figure_json)
+
+
+def chart_geoplot(ctx):
+    from charts import geoplot
+    from figcache import figure_json
+
+    partitions, (country, year) = ctx.partitions(), ctx.largest_partition()
+    return _chart(lambda: geoplot(partitions, country, year, "attacktype"), figure_json)
+
+
+STAGES = {
+    "csv_load": csv_load,
+    "snapshot_load": snapshot_load,
+    "cube_build": cube_build,
+    "year_kills": year_kills,
+    "map_frame": map_frame,
+    "related_grouping": related_grouping,
+    "partition_filter": partition_filter,
+    "chart_countplot": chart_countplot,
+    "chart_pieplot": chart_pieplot,
+    "chart_facetplot": chart_facetplot,
+    "chart_ratioplot": chart_ratioplot,
+    "chart_densityplot": chart_densityplot,
+    "chart_geoplot": chart_geoplot,
+}
+
+
+def measure(run, repeat):
+    """
+    (best wall time in seconds, peak traced allocation in bytes) of run(), after a warm-up run so that one-off
+    costs (first-call caches of the plotting libraries) stay out of both
+    """
+    run()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), peak
+
+
+def run_benchmarks(rows=ROWS, stages=None, repeat=3, work_dir=None):
+    """
+    One result row (stage, rows, seconds, peak_bytes) per stage and size
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    # Import the plotting libraries up front, so that the first chart stage does not pay for them
+    for module in ("matplotlib.pyplot", "seaborn", "plotly.express"):
+        importlib.import_module(module)
+
+    stages = list(STAGES) if stages is None else stages
+    temporary = work_dir is None
+    if temporary:
+        work_dir = tempfile.mkdtemp(prefix="gtd-bench-")
+    results = []
+    try:
+        for n in rows:
+            ctx = Context(n, work_dir)
+            for name in stages:
+                seconds, peak = measure(STAGES[name](ctx), repeat)
+                results.append({"stage": name, "rows": n, "seconds": seconds, "peak_bytes": peak})
+                print(f"{name:>18} {n:>9} rows {seconds * 1000:10.1f} ms {peak / 1e6:9.1f} MB", flush=True)
+            loader.clear_cache()
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return pd.DataFrame(results)
+
+
+def _cpu_model():
+    # platform.processor() is empty on most Linux systems
+    try:
+        with open("/proc/cpuinfo") as fh:
+            for line in fh:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return ""
+
+
+def environment():
+    import numpy as np
+
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "processor": platform.processor() or _cpu_model(), "cpus": os.cpu_count(),
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as fh:
+        json.dump({"environment": environment(), "results": results.to_dict(orient="records")}, fh, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return pd.DataFrame(json.load(fh)["results"])
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Results next to the baseline with their ratios; `regression` is set where time or peak memory grew by more
+    than `tolerance` (0.25 = 25%)
+    """
+    merged = results.merge(baseline, on=["stage", "rows"], how="left", suffixes=("", "_baseline"))
+    merged["time_ratio"] = merged["seconds"] / merged["seconds_baseline"]
+    merged["memory_ratio"] = merged["peak_bytes"] / merged["peak_bytes_baseline"]
+    merged["regression"] = (merged["time_ratio"] > 1 + tolerance) | (merged["memory_ratio"] > 1 + tolerance)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--stage", action="append", dest="stages", choices=list(STAGES),
+                        help="stage to run (repeatable, default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--work-dir", help="where synthetic datasets are written (default: a temporary directory)")
+    parser.add_argument("--save", metavar="PATH", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, args.stages, args.repeat, args.work_dir)
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        report = compare(results, load_baseline(args.compare), args.tolerance)
+        print(report[["stage", "rows", "seconds", "seconds_baseline", "time_ratio", "memory_ratio", "regression"]]
+              .to_string(index=False))
+        if report["regression"].any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
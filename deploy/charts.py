@@ -0,0 +1,127 @@
+"""
+Chart builders of the dashboard. They take pre-aggregated data (cube rollups, map partitions) and return a
+matplotlib/seaborn or Plotly figure without drawing it, so they can be cached and benchmarked outside Streamlit.
+
+matplotlib, seaborn and plotly are imported inside the functions that draw with them, so a page only pays for the
+libraries of the sections it actually shows.
+"""
+from instrument import traced
+from spatial import level_of_detail
+
+
+def set_labels(ax, xlabel, ylabel, x_fontsize, y_fontsize):
+    ax.set_xlabel(xlabel, fontsize=x_fontsize, labelpad=15)
+    ax.set_ylabel(ylabel, fontsize=y_fontsize, labelpad=14)
+
+
+@traced("chart.countplot")
+def countplot(counts, parameter, criteria):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig = plt.figure(figsize=(7, 5))
+
+    if parameter == "targettype" and criteria is None:
+        ax = sns.barplot(data=counts, y=parameter, x="count")
+        set_labels(ax, "Count", "Target Type", 13, 13)
+        return fig
+
+    elif parameter == "weaptype" and criteria is None:
+        ax = sns.barplot(data=counts, y=parameter, x="count", palette=["tomato"])
+        set_labels(ax, "Count", "Attack Weapon", x_fontsize=10, y_fontsize=10)
+        return fig
+
+    elif parameter == "country" and criteria is None:
+        ax = sns.barplot(data=counts, y=parameter, x="count", palette="pastel")
+        set_labels(ax, "Count", "Country Of Attack", x_fontsize=10, y_fontsize=10)
+        return fig
+
+    elif parameter == "alternative_attack_type" and criteria is not None:
+        title_text = "Political, Economic or Religious Goal"
+        if criteria == "crit2":
+            title_text = "Coercion and Intimidation"
+        elif criteria == "crit3":
+            title_text = "Illegitimate Warfare"
+        ax = sns.barplot(data=counts, y=parameter, x="count", hue=criteria,
+                         palette=["tomato", "limegreen"])
+        set_labels(ax, "Count", "Alternative Attack Type", x_fontsize=10, y_fontsize=10)
+        ax.legend(title=title_text, loc="lower right", labels=["No", "Yes"])
+        return fig
+
+
+@traced("chart.pieplot")
+def pieplot(df_perp_info):
+    import matplotlib.pyplot as plt
+
+    def my_autopct(pct):
+        return ("%.2f%%" % pct) if pct > 10 else ""
+
+    labels = df_perp_info["gname"]
+    values = df_perp_info["count"]
+    fig, ax = plt.subplots(figsize=(18, 14), subplot_kw=dict(aspect="equal"))
+    myexplode = [0.05, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+    ax.pie(values, shadow=True, startangle=90, autopct=my_autopct, pctdistance=0.6, explode=myexplode,
+           textprops={"fontsize": 20})
+    ax.axis("equal")
+    ax.legend(labels, loc='upper right', bbox_to_anchor=(1.3, 0.9), fontsize=15)
+    return fig
+
+
+@traced("chart.facetplot")
+def facetplot(counts):
+    import seaborn as sns
+
+    g = sns.FacetGrid(counts, col="crit3", row="crit2")
+    g.map_dataframe(sns.barplot, x="crit1", y="count")
+    return g
+
+
+@traced("chart.ratioplot")
+def ratioplot(year_kills):
+    import plotly.express as px
+
+    fig_scatter = px.scatter(year_kills, x="iyear", y="kill_ratio", color="country", size="success")
+    fig_scatter.update_layout(title="Fatality-Casualty Ratio", title_x=1)
+    return fig_scatter
+
+
+@traced("chart.densityplot")
+def densityplot(partitions, country, year, color_hue):
+    import plotly.express as px
+
+    geo_df, aggregated = level_of_detail(partitions.get(country, year))
+    fig = px.scatter_mapbox(geo_df, lat="latitude", lon="longitude", size=color_hue,
+                            hover_name="tooltip_text", hover_data=["latitude", "longitude"],
+                            mapbox_style="open-street-map", width=1500)
+    if aggregated:
+        fig.update_layout(title=f"Incidents aggregated into {len(geo_df)} map cells")
+    return fig
+
+
+@traced("chart.geoplot")
+def geoplot(partitions, country, year, color_hue):
+    import plotly.express as px
+
+    geo_df, aggregated = level_of_detail(partitions.get(country, year), by=color_hue)
+    fig = px.scatter_geo(geo_df, lat="latitude", lon="longitude", hover_name="tooltip_text",
+                         color=color_hue, size="casualties", scope="asia", projection="natural earth",
+                         width=1500)
+
+    # Reset the legend title
+    fig.update_layout(legend=dict(title="Attack Type"))
+    if aggregated:
+        fig.update_layout(title=f"Incidents aggregated into {len(geo_df)} map cells")
+    return fig
+
+
+@traced("chart.clusterplot")
+def clusterplot(geo_df, clusters, algorithm):
+    import plotly.express as px
+
+    labels = clusters.set_index("eventid")[algorithm]
+    geo_df = geo_df.assign(cluster=labels.reindex(geo_df["eventid"]).astype(str).to_numpy())
+    geo_df, aggregated = level_of_detail(geo_df, by="cluster")
+    fig = px.scatter_mapbox(geo_df, lat="latitude", lon="longitude", color="cluster", size="casualties",
+                            hover_name="tooltip_text", mapbox_style="open-street-map", zoom=3, width=1500)
+    fig.update_layout(legend=dict(title="Cluster (-1 is noise)"))
+    return fig
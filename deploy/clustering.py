@@ -0,0 +1,200 @@
+"""
+Clustering of attack locations on casualties and related features (the goal in notes.txt: three algorithms, three
+metrics and hyperparameter tuning).
+
+Every candidate of the sweep runs in a process pool. The k-nearest-neighbour connectivity behind agglomerative
+clustering is computed once, cached next to the dataset and handed to the workers. DBSCAN runs on a haversine
+BallTree over grid representatives of the locations (see grid_representatives), which bounds the neighbourhoods it
+holds in memory however densely the attacks are packed. Candidates are scored with Calinski-Harabasz,
+Davies-Bouldin and a sampled silhouette, all sub-quadratic in the number of events, in the space they were fit in:
+k-means and agglomerative clustering in the scaled features, DBSCAN and HDBSCAN in the attack locations (silhouette
+on great-circle distances). The sweep table and the labels of the best candidate per algorithm are persisted as
+dataset artifacts for the dashboard:
+
+    python deploy/clustering.py --data data/combined_data.csv --workers 4
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import DBSCAN, AgglomerativeClustering, KMeans, MiniBatchKMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+from sklearn.neighbors import kneighbors_graph
+from sklearn.preprocessing import StandardScaler
+
+from loader import DATA_PATH, load_dataset, load_file_artifact, read_artifact, store_artifact
+
+EARTH_RADIUS_KM = 6371.0
+MINIBATCH_ROWS = 50000
+SILHOUETTE_SAMPLE = 5000
+CONNECTIVITY_NEIGHBORS = 10
+# DBSCAN grid cells are eps_km / DBSCAN_GRID_DIVISIONS wide
+DBSCAN_GRID_DIVISIONS = 20
+# Density-based algorithms, fit on the locations alone
+LOCATION_ALGORITHMS = {"dbscan", "hdbscan"}
+
+CANDIDATES = (
+    [("kmeans", {"n_clusters": k}) for k in (4, 6, 8, 10, 12)]
+    + [("dbscan", {"eps_km": eps, "min_samples": m}) for eps in (10, 25, 50) for m in (5, 10, 20)]
+    + [("agglomerative", {"n_clusters": k}) for k in (6, 8, 10, 12)]
+)
+
+try:
+    from sklearn.cluster import HDBSCAN
+except ImportError:  # scikit-learn < 1.3
+    HDBSCAN = None
+else:
+    CANDIDATES += [("hdbscan", {"min_cluster_size": m}) for m in (25, 50, 100)]
+
+
+def location_radians(frame):
+    return np.radians(frame[["latitude", "longitude"]].to_numpy(dtype=np.float64))
+
+
+def build_features(frame):
+    """
+    Scaled features: position, casualties, kills and a one-hot encoding of the attack type
+    """
+    numeric = frame[["latitude", "longitude", "casualties", "nkill"]].astype(np.float64)
+    numeric[["casualties", "nkill"]] = np.log1p(numeric[["casualties", "nkill"]].clip(lower=0))
+    attack = pd.get_dummies(frame["attacktype"], prefix="attack", dtype=np.float64)
+    return StandardScaler().fit_transform(pd.concat([numeric, attack], axis=1).to_numpy())
+
+
+def grid_representatives(coords, cell_km):
+    """
+    Collapse (latitude, longitude) points in radians into one representative per grid cell of cell_km x cell_km
+    (at the equator; cells narrow towards the poles). Returns (representatives, counts, inverse): the mean position
+    and the number of points of every occupied cell, and the cell of every point.
+
+    DBSCAN on the representatives, weighted by their counts, stands in for DBSCAN on the points: positions move by
+    at most a cell diagonal, and with cells of eps / DBSCAN_GRID_DIVISIONS an eps-neighbourhood spans at most about
+    pi * DBSCAN_GRID_DIVISIONS ** 2 representatives, so the neighbourhoods grow linearly with the occupied cells
+    instead of quadratically with the attacks packed into a city
+    """
+    cells = np.floor(coords / (cell_km / EARTH_RADIUS_KM)).astype(np.int64)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    representatives = np.column_stack([np.bincount(inverse, weights=coords[:, i]) / counts for i in range(2)])
+    return representatives, counts, inverse
+
+
+def _save_sparse(graph, fh):
+    sparse.save_npz(fh, graph)
+
+
+def connectivity_graph(dataset, features):
+    return load_file_artifact(dataset, f"knn_graph_{CONNECTIVITY_NEIGHBORS}.npz",
+                              lambda ds: kneighbors_graph(features, CONNECTIVITY_NEIGHBORS, include_self=False).tocsr(),
+                              _save_sparse, sparse.load_npz)
+
+
+_shared = {}
+
+
+def _init_worker(shared):
+    _shared.update(shared)
+
+
+def _fit(algorithm, params):
+    features = _shared["features"]
+    weights = _shared["weights"]
+    if algorithm == "kmeans":
+        model_cls = MiniBatchKMeans if len(features) > MINIBATCH_ROWS else KMeans
+        model = model_cls(n_clusters=params["n_clusters"], random_state=0, n_init=3)
+        return model.fit_predict(features, sample_weight=weights)
+    if algorithm == "dbscan":
+        representatives, counts, inverse = grid_representatives(_shared["coords"],
+                                                                params["eps_km"] / DBSCAN_GRID_DIVISIONS)
+        # Weighted by event counts only, so that min_samples counts events: with casualty weights a single deadly
+        # attack would be a core point on its own
+        model = DBSCAN(eps=params["eps_km"] / EARTH_RADIUS_KM, min_samples=params["min_samples"], metric="haversine",
+                       algorithm="ball_tree")
+        return model.fit_predict(representatives, sample_weight=counts)[inverse]
+    if algorithm == "hdbscan":
+        model = HDBSCAN(min_cluster_size=params["min_cluster_size"], metric="haversine", algorithm="ball_tree")
+        return model.fit_predict(_shared["coords"])
+    if algorithm == "agglomerative":
+        model = AgglomerativeClustering(n_clusters=params["n_clusters"], connectivity=_shared["connectivity"])
+        return model.fit_predict(features)
+    raise ValueError(f"Unknown clustering algorithm {algorithm!r}")
+
+
+def score(points, labels, metric="euclidean"):
+    """
+    Calinski-Harabasz, Davies-Bouldin and sampled silhouette scores of `labels` over the `points` they were fit on,
+    ignoring DBSCAN/HDBSCAN noise points. With metric="haversine" the points are (latitude, longitude) in radians;
+    the silhouette then uses great-circle distances, while the centroid-based Calinski-Harabasz and Davies-Bouldin
+    treat the coordinates as planar
+    """
+    clustered = labels >= 0
+    points, labels = points[clustered], labels[clustered]
+    n_clusters = len(np.unique(labels))
+    scores = {"n_clusters": n_clusters, "noise": float(1 - clustered.mean()),
+              "calinski_harabasz": np.nan, "davies_bouldin": np.nan, "silhouette": np.nan}
+    if 1 < n_clusters < len(labels):
+        scores["calinski_harabasz"] = calinski_harabasz_score(points, labels)
+        scores["davies_bouldin"] = davies_bouldin_score(points, labels)
+        scores["silhouette"] = silhouette_score(points, labels, metric=metric, random_state=0,
+                                                sample_size=min(SILHOUETTE_SAMPLE, len(labels)))
+    return scores
+
+
+def _run_candidate(candidate):
+    algorithm, params = candidate
+    labels = _fit(algorithm, params)
+    if algorithm in LOCATION_ALGORITHMS:
+        return algorithm, params, labels, score(_shared["coords"], labels, metric="haversine")
+    return algorithm, params, labels, score(_shared["features"], labels)
+
+
+def sweep(dataset, candidates=CANDIDATES, workers=None):
+    """
+    Fit and score every candidate across a process pool. Returns (results, labels): one row per candidate, and
+    the labels of the best candidate (highest sampled silhouette) of each algorithm keyed by eventid. Scores are
+    comparable between the candidates of one algorithm, and between algorithms sharing a `space`
+    """
+    frame = dataset.frame
+    coords = location_radians(frame)
+    features = build_features(frame)
+    shared = {"features": features, "coords": coords, "weights": 1 + frame["casualties"].to_numpy(np.float64)}
+    if any(algorithm == "agglomerative" for algorithm, _ in candidates):
+        shared["connectivity"] = connectivity_graph(dataset, features)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+        outcomes = list(pool.map(_run_candidate, candidates))
+
+    results = pd.DataFrame([{"algorithm": algorithm, "params": repr(params),
+                             "space": "location" if algorithm in LOCATION_ALGORITHMS else "features", **scores}
+                            for algorithm, params, _, scores in outcomes])
+    best = results.fillna({"silhouette": -np.inf}).groupby("algorithm")["silhouette"].idxmax()
+    labels = pd.DataFrame({"eventid": frame["eventid"].to_numpy()})
+    for algorithm, idx in best.items():
+        labels[algorithm] = outcomes[idx][2]
+    return results, labels
+
+
+def load_clusters(dataset):
+    """
+    Persisted labels of the last sweep for this dataset version, or None if it has not been run
+    """
+    return read_artifact(dataset, "clusters")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster attack locations and persist the best labelling")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.data)
+    results, labels = sweep(dataset, workers=args.workers)
+    store_artifact(dataset, "cluster_sweep", results)
+    store_artifact(dataset, "clusters", labels)
+    print(results.sort_values(["algorithm", "silhouette"], ascending=[True, False]).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
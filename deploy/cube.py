@@ -0,0 +1,84 @@
+import numpy as np
+
+from instrument import traced
+from loader import load_artifact, with_sentinels
+
+DIMENSIONS = ["iyear", "country", "attacktype", "weaptype", "targettype", "alternative_attack_type",
+              "doubtterr", "crit1", "crit2", "crit3"]
+MEASURES = ["nkill", "nwound", "casualties", "success"]
+
+
+def build_cube(frame):
+    """
+    Counts and sums of MEASURES for every combination of DIMENSIONS present in the data. Missing dimension values
+    are labelled with their placeholder ("Unknown") as the charts show them
+    """
+    dims = [dim for dim in DIMENSIONS if dim in frame.columns]
+    grouped = frame.groupby(dims, dropna=False, observed=True)
+    cells = grouped[MEASURES].sum()
+    cells.insert(0, "count", grouped.size())
+    return with_sentinels(cells.reset_index())
+
+
+def build_group_counts(frame):
+    counts = frame["gname"].value_counts(dropna=False).rename("count")
+    # Categorical value_counts() also lists categories without any rows
+    counts = counts[counts > 0]
+    return with_sentinels(counts.rename_axis("gname").reset_index())
+
+
+def _mask(cells, filters):
+    mask = np.ones(len(cells), dtype=bool)
+    for col, value in filters.items():
+        if callable(value):
+            mask &= value(cells[col]).to_numpy()
+        elif isinstance(value, (list, tuple, set)):
+            mask &= cells[col].isin(value).to_numpy()
+        else:
+            mask &= (cells[col] == value).to_numpy()
+    return mask
+
+
+class Cube:
+    """
+    Pre-aggregated view of the dataset. Chart code reads small slices of it instead of grouping raw rows
+    """
+
+    def __init__(self, cells, groups):
+        self.cells = cells
+        self.groups = groups
+
+    def slice(self, **filters):
+        if not filters:
+            return self.cells
+        return self.cells[_mask(self.cells, filters)]
+
+    def rollup(self, by, **filters):
+        """
+        Counts and measure sums grouped by the dimension(s) `by`, restricted to cells matching `filters`.
+
+        A filter value may be a scalar, a list of allowed values or a callable taking the column, e.g.
+        doubtterr=lambda col: col != 0.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        return self.slice(**filters).groupby(by, dropna=False, observed=True)[["count"] + MEASURES] \
+            .sum().reset_index()
+
+    def top_groups(self, n=10):
+        return self.groups.head(n)
+
+    def year_kills(self):
+        year_kills = self.rollup(["iyear", "country"]).drop(columns="success")
+        # "success" is the incident count, as in the original groupby(...)["success"].count()
+        year_kills = year_kills.rename(columns={"count": "success", "nkill": "kills", "nwound": "wounded"})
+        # Measures are float32 in the compact dataset; the ratio is computed and rounded in float64 so that it
+        # prints as the rounded value
+        year_kills[["kills", "wounded"]] = year_kills[["kills", "wounded"]].astype(np.float64)
+        year_kills["kill_ratio"] = np.round(year_kills["kills"] / (year_kills["kills"] + year_kills["wounded"] + 1), 3)
+        return year_kills[["iyear", "country", "success", "kills", "wounded", "kill_ratio"]]
+
+
+@traced("load_cube")
+def load_cube(dataset):
+    return Cube(load_artifact(dataset, "cube", build_cube),
+                load_artifact(dataset, "groups", build_group_counts))
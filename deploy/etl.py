@@ -0,0 +1,312 @@
+"""
+Streaming preprocessing of the raw GTD export into the domain tables (perpetrator.csv, target.csv, ...).
+
+Replaces running gtd_southasia.ipynb by hand. The raw file is read in chunks, restricted to the columns the tables
+need, and filtered to one region (and optionally a few countries) inside the chunk loop, so peak memory depends on
+the chunk size rather than on the size of the export:
+
+    python deploy/etl.py --source data/terrorism.csv --region "South Asia" --out-dir data
+
+With --combine the tables are then joined on eventid into data/combined_data.csv, the file the dashboard loads.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from loader import apply_schema
+
+UNKNOWN = "Unknown"
+# Codebook value of doubtterr when it is not known whether the incident is terrorism
+DOUBT_UNKNOWN = -9
+VEHICLE_WEAPON = "Vehicle (not to include vehicle-borne explosives, i.e., car or truck bombs)"
+
+RAW_DTYPES = {
+    "eventid": "int64",
+    "iyear": "int64",
+    "imonth": "int64",
+    "iday": "int64",
+    "approxdate": "object",
+    "extended": "int64",
+    "resolution": "object",
+    "region_txt": "object",
+    "country_txt": "object",
+    "provstate": "object",
+    "city": "object",
+    "vicinity": "int64",
+    "latitude": "float64",
+    "longitude": "float64",
+    "crit1": "int64",
+    "crit2": "int64",
+    "crit3": "int64",
+    "doubtterr": "float64",
+    "alternative": "float64",
+    "alternative_txt": "object",
+    "multiple": "float64",
+    "related": "object",
+    "success": "int64",
+    "suicide": "int64",
+    "attacktype1_txt": "object",
+    "targtype1_txt": "object",
+    "targsubtype1_txt": "object",
+    "corp1": "object",
+    "corp2": "object",
+    "corp3": "object",
+    "natlty1_txt": "object",
+    "gname": "object",
+    "nperps": "float64",
+    "nperpcap": "float64",
+    "weaptype1_txt": "object",
+    "weapsubtype1_txt": "object",
+    "nkill": "float64",
+    "nkillter": "float64",
+    "nwound": "float64",
+    "nwoundte": "float64",
+    "property": "int64",
+    "ishostkid": "float64",
+}
+
+# Casualty columns are imputed with their most frequent value, which is only known once every chunk has been seen
+CASUALTY_COLUMNS = ["nkill", "nkillter", "nwound", "nwoundte", "property", "ishostkid"]
+
+
+def perpetrator_table(chunk):
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "gname": chunk["gname"],
+        "nperpcap": chunk["nperpcap"].fillna(-99),
+        "nperps": chunk["nperps"].fillna(-99),
+    })
+
+
+def coalesce_corp(chunk):
+    """
+    corp1 falls back to corp2, then corp3, then "Unknown"; distinct known corp2/corp3 values are appended to it
+    """
+    corp2 = chunk["corp2"].fillna(UNKNOWN)
+    corp3 = chunk["corp3"].fillna(UNKNOWN)
+    corp1 = chunk["corp1"].fillna(chunk["corp2"]).fillna(chunk["corp3"]).fillna(UNKNOWN)
+
+    add2 = (corp2 != UNKNOWN) & (corp2 != corp1) & (corp2 != corp3)
+    add3 = (corp3 != UNKNOWN) & (corp3 != corp1) & (corp3 != corp2)
+    return corp1 + ("," + corp2).where(add2, "") + ("," + corp3).where(add3, "")
+
+
+def target_table(chunk):
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "targettype": chunk["targtype1_txt"],
+        "targsubtype": chunk["targsubtype1_txt"],
+        "corp1": coalesce_corp(chunk),
+        "nationality": chunk["natlty1_txt"].fillna(UNKNOWN),
+    })
+
+
+def incident_table(chunk):
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "crit1": chunk["crit1"],
+        "crit2": chunk["crit2"],
+        "crit3": chunk["crit3"],
+        # Both are null for a few events of the export. A missing doubtterr is the codebook's "unknown", which keeps
+        # it a plain integer like every other cube dimension; multiple stays missing
+        "doubtterr": chunk["doubtterr"].fillna(DOUBT_UNKNOWN).astype("int64"),
+        "alternative": chunk["alternative"].astype("Int64").astype("object").fillna(UNKNOWN),
+        "alternative_attack_type": chunk["alternative_txt"].fillna(UNKNOWN),
+        "multiple": chunk["multiple"].astype("Int8"),
+        "related": chunk["related"].fillna(UNKNOWN),
+    })
+
+
+def location_table(chunk):
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "country": chunk["country_txt"],
+        "province": chunk["provstate"],
+        "city": chunk["city"].fillna(UNKNOWN),
+        "vicinity": chunk["vicinity"],
+        "latitude": chunk["latitude"],
+        "longitude": chunk["longitude"],
+    })
+
+
+def event_table(chunk):
+    return chunk[["eventid", "iyear", "imonth", "iday", "approxdate", "extended", "resolution"]]
+
+
+def attack_table(chunk):
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "attacktype": chunk["attacktype1_txt"],
+        "success": chunk["success"],
+        "suicide": chunk["suicide"],
+    })
+
+
+def weapon_table(chunk):
+    weaptype = chunk["weaptype1_txt"].str.strip()
+    return pd.DataFrame({
+        "eventid": chunk["eventid"],
+        "weaptype": weaptype.where(weaptype != VEHICLE_WEAPON, "Vehicles"),
+        "weapsubtype": chunk["weapsubtype1_txt"].str.strip().fillna(UNKNOWN),
+    })
+
+
+def casualties_table(chunk):
+    return chunk[["eventid"] + CASUALTY_COLUMNS]
+
+
+TABLES = {
+    "perpetrator": perpetrator_table,
+    "target": target_table,
+    "incident": incident_table,
+    "location": location_table,
+    "event": event_table,
+    "attack": attack_table,
+    "weapon": weapon_table,
+}
+
+
+def read_chunks(source, region=None, countries=None, chunksize=50000):
+    """
+    Chunks of the raw export restricted to the columns in RAW_DTYPES, one region and optionally some countries.
+
+    Rows repeating an eventid already seen in an earlier chunk are dropped, like drop_duplicates() in the notebook.
+    """
+    seen = set()
+    reader = pd.read_csv(source, encoding="latin-1", usecols=list(RAW_DTYPES), dtype=RAW_DTYPES,
+                         chunksize=chunksize)
+    for chunk in reader:
+        mask = np.ones(len(chunk), dtype=bool)
+        if region is not None:
+            mask &= (chunk["region_txt"] == region).to_numpy()
+        if countries:
+            mask &= chunk["country_txt"].isin(countries).to_numpy()
+        chunk = chunk[mask]
+        chunk = chunk[~chunk["eventid"].isin(seen)].drop_duplicates("eventid")
+        if len(chunk):
+            seen.update(chunk["eventid"].tolist())
+            yield chunk
+
+
+def _append_csv(frame, path, first):
+    frame.to_csv(path, mode="w" if first else "a", header=first, index=False)
+
+
+def mode_values(counts):
+    return {col: counter.idxmax() for col, counter in counts.items() if len(counter)}
+
+
+def impute_casualties(raw_path, out_path, modes, chunksize=50000):
+    first = True
+    for chunk in pd.read_csv(raw_path, chunksize=chunksize):
+        chunk = chunk.fillna(modes)
+        chunk[CASUALTY_COLUMNS] = chunk[CASUALTY_COLUMNS].astype("int64")
+        _append_csv(chunk, out_path, first)
+        first = False
+
+
+def _write_tables(source, out_dir, region, countries, chunksize):
+    raw_casualties = os.path.join(out_dir, "casualties.raw.csv")
+    counts = {col: pd.Series(dtype="int64") for col in CASUALTY_COLUMNS}
+    rows = 0
+
+    for chunk in read_chunks(source, region, countries, chunksize):
+        first = rows == 0
+        for name, build in TABLES.items():
+            _append_csv(build(chunk), os.path.join(out_dir, name + ".csv"), first)
+        _append_csv(casualties_table(chunk), raw_casualties, first)
+        for col in CASUALTY_COLUMNS:
+            counts[col] = counts[col].add(chunk[col].value_counts(), fill_value=0)
+        rows += len(chunk)
+
+    if rows:
+        impute_casualties(raw_casualties, os.path.join(out_dir, "casualties.csv"), mode_values(counts), chunksize)
+        os.remove(raw_casualties)
+    return rows
+
+
+def run(source, out_dir, region="South Asia", countries=None, chunksize=50000):
+    """
+    Write one CSV per domain table (plus casualties.csv) into out_dir. Returns the number of events written.
+
+    The tables are built in a staging directory inside out_dir and moved into place only once all of them are
+    complete, so a failed run leaves the tables of the previous one untouched. Raises ValueError when no event
+    matches the region and countries, rather than leaving the previous tables to be combined as if they were new.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=out_dir, prefix=".etl-")
+    try:
+        rows = _write_tables(source, staging, region, countries, chunksize)
+        if not rows:
+            selection = ", ".join(filter(None, [region and f"region {region!r}",
+                                                countries and f"countries {', '.join(countries)}"]))
+            raise ValueError(f"No events of {source} match {selection or 'the filters'}")
+        for name in TABLE_FILES:
+            path = os.path.join(staging, name + ".csv")
+            if os.path.exists(path):
+                os.replace(path, os.path.join(out_dir, name + ".csv"))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return rows
+
+
+TABLE_FILES = list(TABLES) + ["casualties"]
+FILL_UNKNOWN = ["gname", "targettype", "corp1", "nationality"]
+FILL_MODE = ["nperps", "nperpcap"]
+
+
+def combine(table_dir, out_path=None):
+    """
+    Join the domain tables one-to-one on eventid into the combined dataset.
+
+    Raises ValueError when a table has duplicate eventids or does not cover exactly the same events as event.csv,
+    instead of silently misaligning rows. The result is written to out_path when given.
+    """
+    combined = pd.read_csv(os.path.join(table_dir, "event.csv"))
+    for name in TABLE_FILES:
+        if name == "event":
+            continue
+        table = pd.read_csv(os.path.join(table_dir, name + ".csv"))
+        if len(table) != len(combined):
+            raise ValueError(f"{name}.csv has {len(table)} rows but event.csv has {len(combined)}")
+        combined = combined.merge(table, on="eventid", how="inner", validate="one_to_one")
+        if len(combined) != len(table):
+            raise ValueError(f"{name}.csv does not cover the same eventids as event.csv")
+
+    combined = combined.dropna(subset=["latitude", "longitude"])
+    combined[FILL_UNKNOWN] = combined[FILL_UNKNOWN].fillna(UNKNOWN)
+    # Every mode in one pass rather than a value_counts() per column
+    modes = combined[FILL_MODE].mode().iloc[0]
+    combined[FILL_MODE] = combined[FILL_MODE].fillna(modes)
+    combined["casualties"] = combined["nkill"] + combined["nwound"]
+    combined = apply_schema(combined.reset_index(drop=True))
+
+    if out_path is not None:
+        combined.to_csv(out_path, index=False)
+    return combined
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the GTD domain tables from the raw export")
+    parser.add_argument("--source", default="data/terrorism.csv")
+    parser.add_argument("--out-dir", default="data")
+    parser.add_argument("--region", default="South Asia", help='region_txt to keep, "" for every region')
+    parser.add_argument("--country", action="append", dest="countries", help="country_txt to keep (repeatable)")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--combine", action="store_true", help="also join the tables into combined_data.csv")
+    args = parser.parse_args()
+
+    rows = run(args.source, args.out_dir, args.region or None, args.countries, args.chunksize)
+    print(f"Wrote {rows} events to {args.out_dir}")
+    if args.combine:
+        out_path = os.path.join(args.out_dir, "combined_data.csv")
+        combined = combine(args.out_dir, out_path)
+        print(f"Wrote {len(combined)} events to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
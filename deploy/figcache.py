@@ -0,0 +1,178 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+# Prefix of files being written to the disk tier, see FigureCache.put
+TEMP_PREFIX = ".tmp-"
+
+
+def figure_png(fig):
+    """
+    Rasterize a matplotlib figure (or a seaborn grid) to PNG bytes and release it
+    """
+    import matplotlib.pyplot as plt
+
+    fig = getattr(fig, "figure", fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def figure_json(fig):
+    return fig.to_json().encode("utf-8")
+
+
+class FigureCache:
+    """
+    Rendered charts keyed on (chart id, filter parameters, dataset version).
+
+    Entries are PNG bytes for matplotlib/seaborn charts and figure JSON for Plotly charts. The in-memory tier is
+    bounded by max_bytes with least-recently-used eviction; with disk_dir set, entries are also written to disk and
+    survive restarts. The disk tier is bounded by max_disk_bytes the same way, ordered by file mtime, so entries of
+    old dataset versions (no longer read) are the first to go. Its size is tracked per process: several processes
+    sharing disk_dir each keep it within their own view of the directory.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_files = OrderedDict()
+        self.disk_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+
+    def _scan_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith(TEMP_PREFIX):
+                # Left behind by a process that died while writing
+                _remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.disk_files[name] = size
+            self.disk_size += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_size > self.max_disk_bytes and len(self.disk_files) > 1:
+            name, size = self.disk_files.popitem(last=False)
+            self.disk_size -= size
+            self.disk_evictions += 1
+            _remove(os.path.join(self.disk_dir, name))
+
+    def _write_disk(self, key, payload):
+        path = self._disk_path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(payload)
+            os.replace(tmp, path)
+        except BaseException:
+            _remove(tmp)
+            raise
+        name = os.path.basename(path)
+        self.disk_size += len(payload) - self.disk_files.pop(name, 0)
+        self.disk_files[name] = len(payload)
+        self._evict_disk()
+
+    def _insert(self, key, payload):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = payload
+        self.size += len(payload)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return payload
+
+            if self.disk_dir:
+                path = self._disk_path(key)
+                try:
+                    with open(path, "rb") as fh:
+                        payload = fh.read()
+                except OSError:
+                    payload = None
+                if payload is not None:
+                    try:
+                        # The mtime orders the disk tier for eviction, also after a restart
+                        os.utime(path)
+                    except OSError:
+                        pass
+                    name = os.path.basename(path)
+                    self.disk_size += len(payload) - self.disk_files.pop(name, 0)
+                    self.disk_files[name] = len(payload)
+                    self._insert(key, payload)
+                    self.disk_hits += 1
+                    return payload
+
+            self.misses += 1
+            return None
+
+    def put(self, key, payload):
+        with self._lock:
+            self._insert(key, payload)
+            if self.disk_dir:
+                self._write_disk(key, payload)
+
+    def get_or_render(self, key, render):
+        """
+        The cached payload for key, calling render() to produce it only on a miss
+        """
+        payload = self.get(key)
+        if payload is None:
+            payload = render()
+            self.put(key, payload)
+        return payload
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "disk_hits": self.disk_hits,
+                "misses": self.misses, "evictions": self.evictions, "disk_entries": len(self.disk_files),
+                "disk_bytes": self.disk_size, "disk_evictions": self.disk_evictions}
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+FIGURES = FigureCache(int(os.environ.get("FIGURE_CACHE_BYTES", DEFAULT_MAX_BYTES)),
+                      os.environ.get("FIGURE_CACHE_DIR") or None,
+                      int(os.environ.get("FIGURE_CACHE_DISK_BYTES", DEFAULT_MAX_DISK_BYTES)))
@@ -0,0 +1,254 @@
+"""
+Incremental ingest of a new GTD release into the combined dataset.
+
+The release is run through the same ETL and combine stages as a full build, then diffed against the current
+dataset by eventid and a per-row content hash. Only the inserted, updated and deleted events are applied, and the
+derived artifacts (cube, perpetrator counts, map partitions, related-event groups, row hashes) are patched with the
+delta instead of being rebuilt from the whole history:
+
+    python deploy/ingest.py --source data/terrorism_2019.csv --release 2019
+
+The delta is stored as a segment next to the dataset snapshot rather than by rewriting combined_data.csv. Exporting
+the CSV with every segment folded in is a separate step, e.g. after the last release of a batch:
+
+    python deploy/ingest.py --export
+"""
+import argparse
+import bisect
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import etl
+from cube import DIMENSIONS, MEASURES, build_cube, build_group_counts, load_cube
+from loader import (DATA_PATH, append_segment, compact, concat_frames, export_dataset, load_artifact, load_dataset,
+                    store_artifact)
+from partitions import build_map_frame, map_partitions, related_partitions
+from related import UNKNOWN, group_related, related_links
+
+
+def row_hashes(frame):
+    return pd.DataFrame({
+        "eventid": frame["eventid"].to_numpy(),
+        "row_hash": pd.util.hash_pandas_object(frame, index=False).to_numpy(),
+    })
+
+
+def load_row_hashes(dataset):
+    return load_artifact(dataset, "row_hashes", row_hashes)
+
+
+class Delta:
+    """
+    Differences between the current dataset and a release, by eventid
+    """
+
+    def __init__(self, inserted, updated, deleted):
+        self.inserted = inserted
+        self.updated = updated
+        self.deleted = deleted
+
+    def __len__(self):
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+    @property
+    def removed(self):
+        # Old versions of these events leave the dataset
+        return np.concatenate([self.updated, self.deleted])
+
+    @property
+    def added(self):
+        # New versions of these events enter the dataset
+        return np.concatenate([self.inserted, self.updated])
+
+
+def diff(current_hashes, release, partial=False):
+    """
+    Compare row hashes of the current dataset with the release. With partial=True the release only holds new or
+    revised events, so events missing from it are not treated as deleted
+    """
+    old = pd.Series(current_hashes["row_hash"].to_numpy(), index=current_hashes["eventid"].to_numpy())
+    new = row_hashes(release)
+    new = pd.Series(new["row_hash"].to_numpy(), index=new["eventid"].to_numpy())
+
+    known = new.index.isin(old.index)
+    inserted = new.index[~known].to_numpy()
+    updated = new.index[known][new[known].to_numpy() != old.reindex(new.index[known]).to_numpy()].to_numpy()
+    deleted = np.empty(0, dtype=np.int64) if partial else old.index[~old.index.isin(new.index)].to_numpy()
+    return Delta(inserted, updated, deleted)
+
+
+def update_cells(cells, keys, measures, added, removed):
+    """
+    Add the rollup of the added rows to an aggregate and subtract the rollup of the removed ones
+    """
+    removed = removed.copy()
+    removed[measures] = -removed[measures]
+    cells = pd.concat([cells, added, removed], ignore_index=True)
+    cells = cells.groupby(keys, dropna=False, observed=True)[measures].sum().reset_index()
+    return cells[cells["count"] != 0].reset_index(drop=True)
+
+
+def _partition_order(key):
+    # The order of a frame sorted on PARTITION_KEYS: countries are categoricals with sorted categories
+    return str(key[0]), key[1]
+
+
+def update_partitions(index, removed, added_map):
+    """
+    The frame of a (country, iyear) PartitionIndex without the events of `removed` and with the rows of added_map,
+    rebuilding only the partitions either of them touches. The ranges between those partitions are taken over
+    whole: the result is a single take() of the contiguous ranges (and re-sorted touched partitions) from one
+    concat of the frame and added_map
+    """
+    frame = index.frame
+    combined = concat_frames([frame, added_map])
+    eventids = combined["eventid"].to_numpy()
+    removed_ids = removed["eventid"].to_numpy()
+    added_rows = {}
+    for row, key in enumerate(zip(added_map["country"], added_map["iyear"].astype(int)), start=len(frame)):
+        added_rows.setdefault(key, []).append(row)
+    affected = set(zip(removed["country"], removed["iyear"].astype(int))) | set(added_rows)
+
+    # offsets are in frame order
+    existing = [_partition_order(key) for key in index.offsets]
+    starts = [start for start, _ in index.offsets.values()]
+    pieces = []
+    position = 0
+    for key in sorted(affected, key=_partition_order):
+        if key in index.offsets:
+            start, stop = index.offsets[key]
+        else:
+            # A new partition goes in front of the first existing one sorting after it
+            i = bisect.bisect_left(existing, _partition_order(key))
+            start = stop = starts[i] if i < len(starts) else len(frame)
+        rows = np.arange(start, stop)
+        rows = np.concatenate([rows[~np.isin(eventids[rows], removed_ids)], added_rows.get(key, [])]).astype(np.int64)
+        pieces.append(np.arange(position, start))
+        pieces.append(rows[np.argsort(eventids[rows], kind="stable")])
+        position = stop
+    pieces.append(np.arange(position, len(frame)))
+    return combined.take(np.concatenate(pieces)).reset_index(drop=True)
+
+
+def update_related(related, removed_ids, added_map):
+    """
+    Regroup only the related-event groups touched by the delta, and splice them into the related map partitions.
+
+    A group is touched when one of its events is removed, or when a new event refers to one of its events (or to
+    an id outside the dataset that the group also refers to). Untouched groups keep their rows and keys. Every
+    regrouped group takes over the key of the old group its smallest surviving event belonged to, unless another
+    part of that group (split by a removal) holds a smaller one; the others get keys no group uses yet. Keys are
+    therefore stable from release to release, but not numbered 0..k-1 like after a full group_related().
+    """
+    old_rel = related.frame
+    new_rel = added_map[added_map["related"].notna() & (added_map["related"] != UNKNOWN)]
+
+    key_of = pd.Series(old_rel["event_key"].to_numpy(), index=old_rel["eventid"].to_numpy())
+    new_links = related_links(new_rel)
+    touched = np.unique(np.concatenate([removed_ids, new_rel["eventid"].to_numpy(),
+                                        new_links["related_eventid"].to_numpy()]))
+    affected = key_of.reindex(touched).dropna().unique()
+    outside = touched[~np.isin(touched, key_of.index.to_numpy())]
+    if len(outside):
+        # Groups referring to the ids outside them, matched as whole digit runs like related_links() extracts them
+        pattern = r"(?<!\d)(?:" + "|".join(map(str, outside)) + r")(?!\d)"
+        referring = old_rel["related"].str.contains(pattern).to_numpy(dtype=bool)
+        affected = np.union1d(affected, old_rel["event_key"].to_numpy()[referring])
+
+    members = old_rel[old_rel["event_key"].isin(affected)]
+    kept = members[~members["eventid"].isin(removed_ids)]
+    regrouped = group_related(concat_frames([kept.drop(columns="event_key"), new_rel[kept.columns.drop("event_key")]]))
+
+    claims = pd.DataFrame({"component": regrouped["event_key"].to_numpy(), "eventid": regrouped["eventid"].to_numpy(),
+                           "old_key": key_of.reindex(regrouped["eventid"]).to_numpy()})
+    claims = claims.dropna(subset=["old_key"]).sort_values("eventid")
+    claims = claims.drop_duplicates("component").drop_duplicates("old_key")
+    keys = pd.Series(claims["old_key"].to_numpy(dtype=np.int64), index=claims["component"].to_numpy())
+    fresh = np.setdiff1d(regrouped["event_key"].unique(), keys.index.to_numpy())
+    next_key = int(old_rel["event_key"].max()) + 1 if len(old_rel) else 0
+    keys = pd.concat([keys, pd.Series(next_key + np.arange(len(fresh)), index=fresh)])
+    regrouped["event_key"] = keys.reindex(regrouped["event_key"]).to_numpy(dtype=np.int64)
+
+    return update_partitions(related, members, regrouped[old_rel.columns])
+
+
+def apply_delta(dataset, release, delta, release_name=None):
+    """
+    Apply the delta to the stored dataset as a segment (see loader.append_segment()) and patch every derived
+    artifact. Returns the new Dataset
+    """
+    frame = dataset.frame
+    removed = frame[frame["eventid"].isin(delta.removed)]
+    added = release[release["eventid"].isin(delta.added)][frame.columns]
+
+    cube = load_cube(dataset)
+    maps = map_partitions(dataset)
+    related = related_partitions(dataset)
+    hashes = load_row_hashes(dataset)
+
+    new_dataset = append_segment(dataset, added, delta.removed, release_name)
+
+    dims = [dim for dim in DIMENSIONS if dim in frame.columns]
+    store_artifact(new_dataset, "cube", update_cells(cube.cells, dims, ["count"] + MEASURES,
+                                                     build_cube(added), build_cube(removed)))
+    store_artifact(new_dataset, "groups", update_cells(cube.groups, ["gname"], ["count"],
+                                                       build_group_counts(added), build_group_counts(removed))
+                   .sort_values("count", ascending=False, kind="stable").reset_index(drop=True))
+
+    added_map = build_map_frame(added)
+    store_artifact(new_dataset, "map", update_partitions(maps, removed, added_map))
+    store_artifact(new_dataset, "map_related", update_related(related, delta.removed, added_map))
+
+    new_hashes = pd.concat([hashes[~hashes["eventid"].isin(delta.removed)], row_hashes(added)],
+                           ignore_index=True)
+    store_artifact(new_dataset, "row_hashes", new_hashes)
+    return new_dataset
+
+
+def ingest(source, path=DATA_PATH, release_name=None, region="South Asia", countries=None, partial=False,
+           chunksize=50000):
+    """
+    Ingest a raw GTD release into the dataset at `path`. Returns the Delta that was applied
+    """
+    with tempfile.TemporaryDirectory() as table_dir:
+        etl.run(source, table_dir, region, countries, chunksize)
+        release = etl.combine(table_dir)
+
+    dataset = load_dataset(path)
+    # Row hashes depend on dtypes, so the release is brought into the same compact representation as the dataset
+    release = compact(release)[dataset.frame.columns]
+    delta = diff(load_row_hashes(dataset), release, partial)
+    if len(delta):
+        apply_delta(dataset, release, delta, release_name or os.path.basename(source))
+    return delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a new GTD release to the combined dataset")
+    parser.add_argument("--source", help="raw GTD export of the new release")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--release", help="release name recorded in the manifest (defaults to the file name)")
+    parser.add_argument("--region", default="South Asia", help='region_txt to keep, "" for every region')
+    parser.add_argument("--country", action="append", dest="countries", help="country_txt to keep (repeatable)")
+    parser.add_argument("--partial", action="store_true", help="the release only contains new or revised events")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--export", action="store_true",
+                        help="write the CSV with every ingested release folded in (after ingesting --source, if given)")
+    args = parser.parse_args()
+    if args.source is None and not args.export:
+        parser.error("--source or --export is required")
+
+    if args.source is not None:
+        delta = ingest(args.source, args.data, args.release, args.region or None, args.countries, args.partial,
+                       args.chunksize)
+        print(f"{len(delta.inserted)} inserted, {len(delta.updated)} updated, {len(delta.deleted)} deleted")
+    if args.export:
+        dataset = export_dataset(args.data)
+        print(f"Exported {len(dataset.frame)} events to {dataset.source}")
+
+
+if __name__ == "__main__":
+    main()
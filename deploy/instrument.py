@@ -0,0 +1,219 @@
+"""
+Timing/memory spans for the dashboard's hot paths.
+
+Every span records its wall time, the rows it processed (when the caller sets them) and its memory growth, tagged
+with the page/section of the rerun it belongs to. Records are kept in a bounded in-process buffer for the admin panel
+and, when METRICS_LOG is set, appended to that file as JSON lines (written out at the end of every rerun):
+
+    METRICS_LOG=logs/metrics.jsonl streamlit run deploy/app.py
+
+The data-prep steps (dataset and artifact loads, the cube, map partitions, search) and the chart builders are
+traced where they are defined, so their spans are recorded whoever calls them: the dashboard, the query server or
+a script.
+
+Memory growth is measured process-wide, so spans running at the same time in other sessions or server threads add
+to each other's numbers. It is a hint on a busy server; profile one rerun with capture("tracemalloc") to attribute
+allocations.
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+MAX_RECORDS = 5000
+PROFILE_LINES = 40
+
+_lock = threading.Lock()
+_records = deque(maxlen=MAX_RECORDS)
+_context = threading.local()
+_log_path = None
+_log_file = None
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+
+def _metrics_log():
+    """
+    The open METRICS_LOG file (None when unset), reopened when the variable changes. Called with _lock held
+    """
+    global _log_path, _log_file
+    path = os.environ.get("METRICS_LOG") or None
+    if path != _log_path:
+        if _log_file is not None:
+            _log_file.close()
+        _log_path, _log_file = path, None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _log_file = open(path, "a")
+    return _log_file
+
+
+def _emit(record):
+    line = json.dumps(record) + "\n"
+    with _lock:
+        _records.append(record)
+        log = _metrics_log()
+        if log is not None:
+            log.write(line)
+            # Records of a rerun stay buffered until the rerun ends, spans outside a rerun are written right away
+            if record["run_id"] is None or record["span"] == "rerun":
+                log.flush()
+
+
+@contextmanager
+def rerun(section):
+    """
+    Scope of one script rerun: spans inside it are tagged with `section` and a run id, and the rerun itself is
+    recorded as the span "rerun"
+    """
+    _context.run_id = uuid.uuid4().hex[:12]
+    _context.section = section
+    try:
+        with span("rerun"):
+            yield
+    finally:
+        _context.run_id = _context.section = None
+
+
+def set_section(section):
+    _context.section = section
+
+
+@contextmanager
+def span(name, rows=None):
+    """
+    Time the enclosed block. Set `.rows` on the yielded Span to record how many rows the step processed.
+
+    Memory is the growth of traced memory while tracemalloc runs (see capture()), otherwise the growth of the
+    resident set size; both are process-wide, so concurrent spans are included
+    """
+    current = Span(name)
+    current.rows = rows
+    tracing = tracemalloc.is_tracing()
+    base = tracemalloc.get_traced_memory()[0] if tracing else None
+    rss = None if tracing else _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - start
+        if tracing:
+            memory = tracemalloc.get_traced_memory()[0] - base
+        else:
+            end_rss = _rss_bytes()
+            memory = None if rss is None or end_rss is None else end_rss - rss
+        _emit({
+            "ts": time.time(),
+            "run_id": getattr(_context, "run_id", None),
+            "section": getattr(_context, "section", None),
+            "span": name,
+            "seconds": seconds,
+            "rows": None if current.rows is None else int(current.rows),
+            "memory_bytes": memory,
+        })
+
+
+def records():
+    with _lock:
+        return pd.DataFrame(list(_records), columns=["ts", "run_id", "section", "span", "seconds", "rows",
+                                                     "memory_bytes"])
+
+
+def percentiles(frame=None, by=("section", "span")):
+    """
+    Latency percentiles (in milliseconds) and call counts of the recorded spans
+    """
+    frame = records() if frame is None else frame
+    by = list(by)
+    if frame.empty:
+        return pd.DataFrame(columns=by + ["count", "p50_ms", "p90_ms", "p99_ms", "max_ms"])
+    grouped = frame.groupby(by, dropna=False)["seconds"]
+    summary = grouped.agg(
+        count="size",
+        p50_ms=lambda s: np.percentile(s, 50) * 1000,
+        p90_ms=lambda s: np.percentile(s, 90) * 1000,
+        p99_ms=lambda s: np.percentile(s, 99) * 1000,
+        max_ms="max",
+    ).reset_index()
+    summary["max_ms"] *= 1000
+    return summary.sort_values("p90_ms", ascending=False).reset_index(drop=True)
+
+
+class Capture:
+    def __init__(self, mode):
+        self.mode = mode
+        self.report = None
+
+
+@contextmanager
+def capture(mode):
+    """
+    Profile the enclosed block with "cprofile" (functions by cumulative time) or "tracemalloc" (allocation sites
+    still holding memory at the end). The text report is set on the yielded Capture
+    """
+    result = Capture(mode)
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            result.report = out.getvalue()
+    elif mode == "tracemalloc":
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(25)
+        try:
+            yield result
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            lines = [f"Peak traced memory: {peak / 1e6:.1f} MB"]
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_LINES]]
+            result.report = "\n".join(lines)
+    else:
+        raise ValueError(f"Unknown capture mode {mode!r}")
+
+
+def traced(name, rows=None):
+    """
+    Decorator recording every call as the span `name`; `rows(result)` gives the number of rows the call processed
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = fn(*args, **kwargs)
+                if rows is not None and result is not None:
+                    current.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
@@ -0,0 +1,597 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrument import span, traced
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # Copy-on-write is the default from pandas 3. With it, column selections and row slices of the shared dataset
+    # are lazy views, and a caller modifying one gets its own copy instead of changing the frame of every session.
+    pd.set_option("mode.copy_on_write", True)
+
+DATA_PATH = "data/combined_data.csv"
+
+# Explicit dtypes for the columns produced by combined_analysis.ipynb. Integer columns which turn out to hold nulls
+# are widened to float64 instead of failing the conversion; columns not listed here keep the inferred dtype.
+SCHEMA = {
+    "eventid": "int64",
+    "iyear": "int64",
+    "imonth": "int64",
+    "iday": "int64",
+    "extended": "int64",
+    "crit1": "int64",
+    "crit2": "int64",
+    "crit3": "int64",
+    "doubtterr": "int64",
+    "multiple": "int64",
+    "success": "int64",
+    "suicide": "int64",
+    "vicinity": "int64",
+    "property": "int64",
+    "ishostkid": "int64",
+    "nkill": "float64",
+    "nkillter": "float64",
+    "nwound": "float64",
+    "nwoundte": "float64",
+    "nperps": "float64",
+    "nperpcap": "float64",
+    "casualties": "float64",
+    "latitude": "float64",
+    "longitude": "float64",
+    "attacktype": "str",
+    "gname": "str",
+    "targettype": "str",
+    "targsubtype": "str",
+    "corp1": "str",
+    "nationality": "str",
+    "country": "str",
+    "province": "str",
+    "city": "str",
+    "weaptype": "str",
+    "weapsubtype": "str",
+    "alternative": "str",
+    "alternative_attack_type": "str",
+    "related": "str",
+    "approxdate": "str",
+    "resolution": "str",
+}
+
+# In-memory dtypes of the loaded dataset. Strings are dictionary-encoded as categoricals, numerics are downcast to
+# the smallest type holding their range and coordinates are float32 (well under a metre of error). Integer columns
+# holding nulls get the nullable variant (e.g. Int8) instead of being widened to float.
+COMPACT_SCHEMA = {
+    "iyear": "int16",
+    "imonth": "int8",
+    "iday": "int8",
+    "extended": "int8",
+    "crit1": "int8",
+    "crit2": "int8",
+    "crit3": "int8",
+    "doubtterr": "int8",
+    "multiple": "int8",
+    "success": "int8",
+    "suicide": "int8",
+    "vicinity": "int8",
+    "property": "Int8",
+    "ishostkid": "Int8",
+    "nperps": "Int32",
+    "nperpcap": "Int32",
+    "nkill": "float32",
+    "nkillter": "float32",
+    "nwound": "float32",
+    "nwoundte": "float32",
+    "casualties": "float32",
+    "latitude": "float32",
+    "longitude": "float32",
+    **{col: "category" for col, dtype in SCHEMA.items() if dtype == "str"},
+}
+
+# Version of the representation the snapshot and every artifact are built in, recorded in the manifest next to the
+# dataset version. A change to COMPACT_SCHEMA changes it by itself; bump ARTIFACT_FORMAT when the way artifacts are
+# built changes, so that files written by older code are rebuilt instead of being mixed with new ones.
+ARTIFACT_FORMAT = 1
+SCHEMA_VERSION = f"{ARTIFACT_FORMAT}." + hashlib.sha1(
+    json.dumps(COMPACT_SCHEMA, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+# Placeholders the preprocessing notebooks fill missing values with. In memory they are plain missing values; they
+# are put back when the dataset is written out and when aggregates are labelled for display.
+UNKNOWN = "Unknown"
+SENTINELS = {
+    "gname": UNKNOWN,
+    "targettype": UNKNOWN,
+    "corp1": UNKNOWN,
+    "nationality": UNKNOWN,
+    "city": UNKNOWN,
+    "weapsubtype": UNKNOWN,
+    "alternative": UNKNOWN,
+    "alternative_attack_type": UNKNOWN,
+    "related": UNKNOWN,
+    "nperps": -99,
+    "nperpcap": -99,
+    "property": -9,
+    "ishostkid": -9,
+}
+
+_HASH_BLOCK = 1 << 20
+
+_lock = threading.RLock()
+_cache = {}
+_artifacts = {}
+_derived = {}
+
+
+class Dataset:
+    """
+    A loaded dataset together with its version (content hash), the GTD release it was built from and its load
+    timings
+    """
+
+    def __init__(self, frame, source, version):
+        self.frame = frame
+        self.source = source
+        self.version = version
+        self.release = None
+        self.cold_seconds = None
+        self.warm_seconds = None
+
+    def memory_report(self):
+        return memory_report(self.frame)
+
+
+def artifact_path(source, suffix):
+    """
+    Path of a derived artifact stored next to the source file, e.g. data/combined_data.parquet
+    """
+    stem, _ = os.path.splitext(source)
+    return stem + suffix
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def apply_schema(frame, schema=None):
+    schema = SCHEMA if schema is None else schema
+    if frame.columns.duplicated().any():
+        frame = frame.loc[:, ~frame.columns.duplicated()].copy()
+    for col, dtype in schema.items():
+        if col not in frame.columns or frame[col].dtype == dtype:
+            continue
+        if dtype == "int64" and frame[col].isna().any():
+            dtype = "float64"
+        if dtype == "str":
+            # Keep missing values missing rather than turning them into the literal string "nan"
+            frame[col] = frame[col].astype(dtype).where(frame[col].notna())
+        else:
+            frame[col] = frame[col].astype(dtype)
+    return frame
+
+
+def compact(frame, schema=None):
+    """
+    The in-memory representation of a frame of the dataset: sentinels replaced by missing values and columns
+    converted to COMPACT_SCHEMA. Columns already in their compact dtype are left alone, so compacting twice is cheap
+    """
+    schema = COMPACT_SCHEMA if schema is None else schema
+    columns = {}
+    for col, dtype in schema.items():
+        if col not in frame.columns:
+            continue
+        values = frame[col]
+        if col in SENTINELS and (values == SENTINELS[col]).any():
+            values = values.mask(values == SENTINELS[col])
+        if dtype == "category":
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("category")
+            elif len(values.cat.categories) > values.nunique():
+                values = values.cat.remove_unused_categories()
+        elif values.dtype != dtype:
+            if dtype[0] == "i" and values.isna().any():
+                dtype = dtype.capitalize()
+            values = values.astype(dtype)
+        if values is not frame[col]:
+            columns[col] = values
+    return frame.assign(**columns) if columns else frame
+
+
+def with_sentinels(frame):
+    """
+    Columns of `frame` with their missing values shown as the SENTINELS placeholder again (as plain objects for
+    string columns), e.g. to write the dataset out or to label aggregates
+    """
+    columns = {}
+    for col, sentinel in SENTINELS.items():
+        if col not in frame.columns or not frame[col].isna().any():
+            continue
+        values = frame[col]
+        if isinstance(sentinel, str):
+            values = values.astype(object)
+        columns[col] = values.fillna(sentinel)
+    return frame.assign(**columns) if columns else frame
+
+
+def memory_report(frame):
+    """
+    Bytes held by every column of `frame` (categories included), largest first
+    """
+    usage = frame.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({"column": usage.index, "dtype": frame.dtypes.astype(str).to_numpy(),
+                           "bytes": usage.to_numpy()})
+    return report.sort_values("bytes", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def _signature(path):
+    """
+    mtime and size of the CSV and of the manifest, which records the segments ingested since the CSV was written
+    """
+    stat = os.stat(path)
+    try:
+        manifest = os.stat(artifact_path(path, ".manifest.json"))
+    except FileNotFoundError:
+        return stat.st_mtime_ns, stat.st_size, None, None
+    return stat.st_mtime_ns, stat.st_size, manifest.st_mtime_ns, manifest.st_size
+
+
+def read_manifest(source):
+    """
+    The manifest stored next to the dataset: the version (and release) of the dataset snapshot and of every
+    artifact built from it, together with the SCHEMA_VERSION they were written in
+    """
+    try:
+        with open(artifact_path(source, ".manifest.json")) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("dataset", {})
+    manifest.setdefault("artifacts", {})
+    return manifest
+
+
+def _atomic_write(path, write):
+    """
+    Call write(tmp) on a temporary file next to `path` and move it into place, so that readers (in this or another
+    process) see either the old or the new file, never a partial one
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _update_manifest(source, name, entry):
+    manifest = read_manifest(source)
+    entry = dict(entry, schema=SCHEMA_VERSION)
+    if name is None:
+        manifest["dataset"] = entry
+    else:
+        manifest["artifacts"][name] = entry
+
+    def write(tmp):
+        with open(tmp, "w") as fh:
+            json.dump(manifest, fh, indent=2)
+
+    _atomic_write(artifact_path(source, ".manifest.json"), write)
+
+
+def _snapshot_files(path):
+    """
+    The Parquet snapshot `path` and the pickle (<stem>.pkl) written in its place when no Parquet engine is installed
+    """
+    stem, _ = os.path.splitext(path)
+    return path, stem + ".pkl"
+
+
+def _write_snapshot(frame, path):
+    parquet, pickle = _snapshot_files(path)
+    try:
+        _atomic_write(parquet, lambda tmp: frame.to_parquet(tmp, index=False))
+        stale = pickle
+    except ImportError:
+        _atomic_write(pickle, frame.to_pickle)
+        stale = parquet
+    if os.path.exists(stale):
+        os.remove(stale)
+
+
+def _read_snapshot(path):
+    """
+    The snapshot written by _write_snapshot(frame, path), or None when there is none this process can read
+    """
+    parquet, pickle = _snapshot_files(path)
+    try:
+        if os.path.exists(parquet):
+            return pd.read_parquet(parquet)
+        if os.path.exists(pickle):
+            return pd.read_pickle(pickle)
+    except ImportError:
+        # A Parquet snapshot written before the engine was uninstalled; it is rebuilt
+        pass
+    return None
+
+
+def _is_current(meta, version):
+    """
+    Whether the manifest entry `meta` describes a file built from dataset `version` by the current SCHEMA_VERSION
+    """
+    return meta.get("version") == version and meta.get("schema") == SCHEMA_VERSION
+
+
+def concat_frames(frames):
+    """
+    pd.concat of compact frames with the same columns. Categorical columns whose categories differ between the
+    frames get the sorted union of them instead of falling back to objects
+    """
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    columns = [{} for _ in frames]
+    for col in frames[0].columns:
+        dtypes = [frame[col].dtype for frame in frames]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and len(set(dtypes)) > 1:
+            categories = dtypes[0].categories
+            for dtype in dtypes[1:]:
+                categories = categories.union(dtype.categories)
+            for frame, replaced in zip(frames, columns):
+                replaced[col] = frame[col].cat.set_categories(categories)
+    frames = [frame.assign(**replaced) if replaced else frame for frame, replaced in zip(frames, columns)]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _segment_files(source, name):
+    return (artifact_path(source, "." + name + ".parquet"),
+            artifact_path(source, "." + name + ".removed.parquet"))
+
+
+def apply_segment(frame, added, removed_ids):
+    """
+    `frame` without the events `removed_ids` and with the rows `added` appended
+    """
+    if len(removed_ids):
+        frame = frame[~frame["eventid"].isin(removed_ids)]
+    return concat_frames([frame, added[frame.columns]])
+
+
+def _load_cold(source):
+    snapshot = artifact_path(source, ".parquet")
+    source_hash = file_hash(source)
+
+    meta = read_manifest(source)["dataset"]
+    # Manifests written before segments existed have no "source": their version is the hash of the CSV
+    current = meta.get("source", meta.get("version")) == source_hash
+    frame = _read_snapshot(snapshot) if current and meta.get("schema") == SCHEMA_VERSION else None
+    rebuilt = frame is None
+    if rebuilt:
+        frame = compact(apply_schema(pd.read_csv(source)))
+        _write_snapshot(frame, snapshot)
+
+    # Segments only apply on top of the CSV they were ingested against; a CSV replaced by hand starts afresh
+    segments = meta.get("segments", []) if current else []
+    for name in segments:
+        added_path, removed_path = _segment_files(source, name)
+        added, removed = _read_snapshot(added_path), _read_snapshot(removed_path)
+        if added is None or removed is None:
+            raise ValueError(f"Segment {name} of {source} is missing; ingest the release again or replace the CSV")
+        frame = apply_segment(frame, compact(added), removed["eventid"].to_numpy())
+
+    version = meta["version"] if current else source_hash
+    # The release stays known when only the snapshot is out of date
+    release = meta.get("release") if current else None
+    if rebuilt:
+        _update_manifest(source, None, {"version": version, "release": release, "rows": len(frame),
+                                        "source": source_hash, "segments": segments})
+    dataset = Dataset(frame, source, version)
+    dataset.release = release
+    return dataset
+
+
+@traced("load_dataset", rows=lambda dataset: len(dataset.frame))
+def load_dataset(path=DATA_PATH):
+    """
+    Load the combined dataset, memoized per process so that every rerun and every session shares one compact
+    (see COMPACT_SCHEMA), read-only frame.
+
+    The CSV is parsed once into a typed Parquet snapshot stored next to it. A change to the file's mtime or size
+    triggers a content hash; the snapshot is rebuilt only when that hash differs from the one it was built from.
+    Segments ingested since the CSV was written (see append_segment()) are applied on top of the snapshot.
+    """
+    source = os.path.abspath(path)
+    start = time.perf_counter()
+    signature = _signature(source)
+
+    with _lock:
+        entry = _cache.get(source)
+        if (entry is not None and entry[0] != signature and entry[0][:2] == signature[:2]
+                and read_manifest(source)["dataset"].get("version") == entry[1].version):
+            # Only artifacts were recorded in the manifest since
+            entry = _cache[source] = (signature, entry[1])
+        if entry is not None and entry[0] == signature:
+            dataset = entry[1]
+            dataset.warm_seconds = time.perf_counter() - start
+            return dataset
+
+        dataset = _load_cold(source)
+        dataset.cold_seconds = time.perf_counter() - start
+        _cache[source] = (signature, dataset)
+        return dataset
+
+
+def _write_dataset(frame, source, release, version=None):
+    """
+    Write `frame` as the CSV and snapshot of the dataset, folding in (and removing) every segment. The dataset
+    version is the hash of the new CSV unless `version` keeps an existing one
+    """
+    segments = read_manifest(source)["dataset"].get("segments", [])
+    _atomic_write(source, lambda tmp: with_sentinels(frame).to_csv(tmp, index=False))
+    _write_snapshot(frame, artifact_path(source, ".parquet"))
+    source_hash = file_hash(source)
+    dataset = Dataset(frame, source, version or source_hash)
+    dataset.release = release
+    _update_manifest(source, None, {"version": dataset.version, "release": release, "rows": len(frame),
+                                    "source": source_hash, "segments": []})
+    for name in segments:
+        for file in _segment_files(source, name):
+            for path in _snapshot_files(file):
+                if os.path.exists(path):
+                    os.remove(path)
+    _cache[source] = (_signature(source), dataset)
+    return dataset
+
+
+def store_dataset(frame, path=DATA_PATH, release=None):
+    """
+    Replace the dataset with `frame`, writing the CSV together with a matching snapshot so that the next load
+    does not have to parse it again. Returns the new Dataset
+    """
+    with _lock:
+        return _write_dataset(compact(frame), os.path.abspath(path), release)
+
+
+def append_segment(dataset, added, removed_ids, release=None):
+    """
+    Apply a delta to `dataset` without rewriting it: the rows `added` (new events and the new versions of revised
+    ones) and the eventids `removed_ids` leaving it are persisted as a segment next to the snapshot, and replayed
+    on top of it by the next cold load. The cost is proportional to the delta; export_dataset() folds the
+    segments into the CSV. Returns the new Dataset
+    """
+    added = compact(added[dataset.frame.columns])
+    removed = pd.DataFrame({"eventid": np.asarray(removed_ids, dtype=np.int64)})
+    digest = hashlib.sha1(dataset.version.encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(added, index=False).to_numpy().tobytes())
+    digest.update(removed["eventid"].to_numpy().tobytes())
+    version = digest.hexdigest()
+    name = "segment-" + version[:12]
+
+    with _lock:
+        added_path, removed_path = _segment_files(dataset.source, name)
+        _write_snapshot(added, added_path)
+        _write_snapshot(removed, removed_path)
+        meta = read_manifest(dataset.source)["dataset"]
+        frame = apply_segment(dataset.frame, added, removed["eventid"].to_numpy())
+        # The manifest is written last: a failure before it leaves the dataset as it was
+        _update_manifest(dataset.source, None, {
+            "version": version, "release": release, "rows": len(frame),
+            "source": meta.get("source", meta.get("version")), "segments": meta.get("segments", []) + [name]})
+        new_dataset = Dataset(frame, dataset.source, version)
+        new_dataset.release = release
+        _cache[dataset.source] = (_signature(dataset.source), new_dataset)
+        return new_dataset
+
+
+def export_dataset(path=DATA_PATH):
+    """
+    Write the dataset back to its CSV with every ingested segment folded in. The dataset keeps its version, so
+    its artifacts stay valid. Returns the Dataset
+    """
+    dataset = load_dataset(path)
+    with _lock:
+        return _write_dataset(dataset.frame, dataset.source, dataset.release, dataset.version)
+
+
+def store_artifact(dataset, name, frame):
+    """
+    Persist an artifact of `dataset` that was built (or updated) outside load_artifact()
+    """
+    with _lock:
+        _write_snapshot(frame, artifact_path(dataset.source, "." + name + ".parquet"))
+        _update_manifest(dataset.source, name,
+                         {"version": dataset.version, "release": dataset.release, "rows": len(frame)})
+        _artifacts[(dataset.source, name)] = (dataset.version, frame)
+
+
+@traced("read_artifact", rows=len)
+def read_artifact(dataset, name):
+    """
+    A persisted artifact of `dataset`, or None when it is missing or was built from another dataset version or
+    SCHEMA_VERSION
+    """
+    key = (dataset.source, name)
+    path = artifact_path(dataset.source, "." + name + ".parquet")
+
+    with _lock:
+        entry = _artifacts.get(key)
+        if entry is not None and entry[0] == dataset.version:
+            return entry[1]
+
+        meta = read_manifest(dataset.source)["artifacts"].get(name, {})
+        if not _is_current(meta, dataset.version):
+            return None
+        frame = _read_snapshot(path)
+        if frame is not None:
+            _artifacts[key] = (dataset.version, frame)
+        return frame
+
+
+def load_artifact(dataset, name, build):
+    """
+    A frame derived from `dataset` by `build(frame)`, persisted next to the dataset as <stem>.<name>.parquet.
+
+    Like the dataset itself the artifact is memoized per process, and it is rebuilt only when the dataset version
+    or the SCHEMA_VERSION it was built from (recorded in the manifest) no longer matches.
+    """
+    with _lock, span("artifact." + name) as current:
+        frame = read_artifact(dataset, name)
+        if frame is None:
+            frame = build(dataset.frame)
+            store_artifact(dataset, name, frame)
+        current.rows = len(frame)
+        return frame
+
+
+def load_file_artifact(dataset, name, build, save, load):
+    """
+    Like load_artifact() for an object that is not a frame (e.g. a sparse matrix): `build(dataset)` is persisted
+    as <stem>.<name> by save(value, file) and read back by load(file), both on binary file objects. It is
+    versioned through the manifest but not memoized, so a large object is only held by its caller
+    """
+    path = artifact_path(dataset.source, "." + name)
+    with _lock:
+        meta = read_manifest(dataset.source)["artifacts"].get(name, {})
+        if _is_current(meta, dataset.version):
+            try:
+                with open(path, "rb") as fh:
+                    return load(fh)
+            except (OSError, ValueError):
+                pass
+        value = build(dataset)
+
+        def write(tmp):
+            with open(tmp, "wb") as fh:
+                save(value, fh)
+
+        _atomic_write(path, write)
+        _update_manifest(dataset.source, name, {"version": dataset.version, "release": dataset.release})
+        return value
+
+
+def derived(dataset, name, build):
+    """
+    An in-memory object built from `dataset` by `build(dataset)`, memoized per process and dataset version
+    """
+    key = (dataset.source, name)
+    with _lock:
+        entry = _derived.get(key)
+        if entry is not None and entry[0] == dataset.version:
+            return entry[1]
+        value = build(dataset)
+        _derived[key] = (dataset.version, value)
+        return value
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _artifacts.clear()
+        _derived.clear()
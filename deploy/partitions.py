@@ -0,0 +1,73 @@
+import numpy as np
+
+from instrument import traced
+from loader import derived, load_artifact, with_sentinels
+from related import group_related
+
+MAP_COLUMNS = ["latitude", "longitude", "city", "country", "casualties", "attacktype", "eventid", "iyear", "related"]
+PARTITION_KEYS = ["country", "iyear"]
+
+
+def build_map_frame(frame):
+    """
+    The columns used by the map views, sorted so that every (country, year) partition is a contiguous row range.
+    Rows within a partition are ordered by eventid, which keeps the order independent of how the dataset was built
+    """
+    return frame[MAP_COLUMNS].sort_values(PARTITION_KEYS + ["eventid"]).reset_index(drop=True)
+
+
+def tooltip_text(frame):
+    """
+    "city, country" hover labels, built only for the rows a map actually draws
+    """
+    places = with_sentinels(frame[["city", "country"]]).astype(str)
+    return places["city"] + ", " + places["country"]
+
+
+def build_related_map_frame(frame):
+    # group_related() keeps row order, so the (country, year) sort survives
+    return group_related(build_map_frame(frame))
+
+
+class PartitionIndex:
+    """
+    Row-offset ranges of a frame sorted on (country, iyear), so that selecting a partition is a slice
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        countries = frame["country"].to_numpy()
+        years = frame["iyear"].to_numpy()
+        change = np.ones(len(frame), dtype=bool)
+        change[1:] = (countries[1:] != countries[:-1]) | (years[1:] != years[:-1])
+        starts = np.flatnonzero(change)
+        stops = np.append(starts[1:], len(frame))
+
+        self.offsets = {}
+        self.years = {}
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            key = (countries[start], int(years[start]))
+            self.offsets[key] = (start, stop)
+            self.years.setdefault(key[0], []).append(key[1])
+
+    def countries(self):
+        return list(self.years)
+
+    def years_for(self, country):
+        return self.years.get(country, [])
+
+    def get(self, country, year):
+        start, stop = self.offsets.get((country, year), (0, 0))
+        return self.frame.iloc[start:stop]
+
+
+@traced("map_partitions", rows=lambda index: len(index.frame))
+def map_partitions(dataset):
+    return derived(dataset, "map_partitions",
+                   lambda ds: PartitionIndex(load_artifact(ds, "map", build_map_frame)))
+
+
+@traced("related_partitions", rows=lambda index: len(index.frame))
+def related_partitions(dataset):
+    return derived(dataset, "related_partitions",
+                   lambda ds: PartitionIndex(load_artifact(ds, "map_related", build_related_map_frame)))
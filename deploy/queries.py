@@ -0,0 +1,303 @@
+"""
+The dashboard's analyses as plain queries, usable without Streamlit (see server.py for the HTTP/JSON front end).
+
+A query is a frozen dataclass holding its parameters. `frame(dataset)` returns the result as a DataFrame (what the
+charts draw) and `run(dataset)` as a list of typed result rows:
+
+    from loader import load_dataset
+    from queries import TopGroups
+
+    TopGroups(n=5).run(load_dataset())  # [GroupCount(gname="Taliban", count=7423), ...]
+"""
+import dataclasses
+import typing
+from dataclasses import dataclass
+
+from cube import load_cube
+from partitions import map_partitions, related_partitions
+from spatial import MAX_MAP_POINTS, level_of_detail, within_bbox
+
+CRITERIA = ("crit1", "crit2", "crit3")
+ENTITIES = ("targettype", "weaptype", "country")
+
+
+def not_terr(doubtterr):
+    return doubtterr != 0
+
+
+@dataclass(frozen=True)
+class GroupCount:
+    gname: str
+    count: int
+
+
+@dataclass(frozen=True)
+class EntityCount:
+    value: str
+    count: int
+
+
+@dataclass(frozen=True)
+class CritCount:
+    alternative_attack_type: str
+    criterion_met: int
+    count: int
+
+
+@dataclass(frozen=True)
+class CritCell:
+    crit1: int
+    crit2: int
+    crit3: int
+    count: int
+
+
+@dataclass(frozen=True)
+class RatioPoint:
+    iyear: int
+    country: str
+    incidents: int
+    kills: float
+    wounded: float
+    kill_ratio: float
+
+
+@dataclass(frozen=True)
+class IncidentPoint:
+    latitude: float
+    longitude: float
+    casualties: float
+    attacktype: str
+    label: str
+    incidents: int
+
+
+def _rows(result_type, frame, columns=None):
+    """
+    One result_type per row of `frame`, taking the dataclass fields from `columns` (field: column) or same-named
+    columns
+    """
+    columns = columns or {}
+    fields = dataclasses.fields(result_type)
+    data = {field.name: frame[columns.get(field.name, field.name)].tolist() for field in fields}
+    return [result_type(**{field.name: field.type(data[field.name][i]) for field in fields})
+            for i in range(len(frame))]
+
+
+class Query:
+    """
+    Base of the query dataclasses: `name` identifies the query in the HTTP API
+    """
+
+    name = None
+    result_type = None
+
+    def params(self):
+        return dataclasses.asdict(self)
+
+    def frame(self, dataset):
+        raise NotImplementedError
+
+    def run(self, dataset):
+        return _rows(self.result_type, self.frame(dataset))
+
+
+@dataclass(frozen=True)
+class TopGroups(Query):
+    """
+    The n perpetrator groups with the most attacks
+    """
+
+    n: int = 10
+
+    name = "top_groups"
+    result_type = GroupCount
+
+    def __post_init__(self):
+        if self.n <= 0:
+            raise ValueError("n must be positive")
+
+    def frame(self, dataset):
+        return load_cube(dataset).top_groups(self.n)
+
+
+@dataclass(frozen=True)
+class EntityCounts(Query):
+    """
+    Attacks per target type, weapon type or country; like the dashboard, all but target types exclude incidents
+    that may not be terrorism
+    """
+
+    entity: str = "targettype"
+
+    name = "entity_counts"
+    result_type = EntityCount
+
+    def __post_init__(self):
+        if self.entity not in ENTITIES:
+            raise ValueError(f"entity must be one of {', '.join(ENTITIES)}")
+
+    def frame(self, dataset):
+        filters = {} if self.entity == "targettype" else {"doubtterr": not_terr}
+        return load_cube(dataset).rollup(self.entity, **filters)
+
+    def run(self, dataset):
+        return _rows(EntityCount, self.frame(dataset), {"value": self.entity})
+
+
+@dataclass(frozen=True)
+class AlternativeCrit(Query):
+    """
+    Alternative attack types of the incidents in doubt of being terrorism, split by whether one inclusion
+    criterion is met
+    """
+
+    criterion: str = "crit1"
+
+    name = "alternative_crit"
+    result_type = CritCount
+
+    def __post_init__(self):
+        if self.criterion not in CRITERIA:
+            raise ValueError(f"criterion must be one of {', '.join(CRITERIA)}")
+
+    def frame(self, dataset):
+        return load_cube(dataset).rollup(["alternative_attack_type", self.criterion], doubtterr=not_terr)
+
+    def run(self, dataset):
+        return _rows(CritCount, self.frame(dataset), {"criterion_met": self.criterion})
+
+
+@dataclass(frozen=True)
+class CritMatrix(Query):
+    """
+    Attacks per combination of the three inclusion criteria, for terrorism (doubtterr == 0) or the incidents in
+    doubt
+    """
+
+    terrorism: bool = True
+
+    name = "crit_matrix"
+    result_type = CritCell
+
+    def frame(self, dataset):
+        return load_cube(dataset).rollup(list(CRITERIA), doubtterr=0 if self.terrorism else not_terr)
+
+
+@dataclass(frozen=True)
+class FatalityRatio(Query):
+    """
+    Kills / (kills + wounded + 1) per country and year, optionally for one country and a range of years
+    """
+
+    country: typing.Optional[str] = None
+    year_from: typing.Optional[int] = None
+    year_to: typing.Optional[int] = None
+
+    name = "fatality_ratio"
+    result_type = RatioPoint
+
+    def frame(self, dataset):
+        year_kills = load_cube(dataset).year_kills()
+        mask = year_kills["iyear"].notna()
+        if self.year_from is not None:
+            mask &= year_kills["iyear"] >= self.year_from
+        if self.year_to is not None:
+            mask &= year_kills["iyear"] <= self.year_to
+        if self.country is not None:
+            mask &= year_kills["country"] == self.country
+        return year_kills[mask]
+
+    def run(self, dataset):
+        return _rows(RatioPoint, self.frame(dataset), {"incidents": "success"})
+
+
+@dataclass(frozen=True)
+class IncidentPoints(Query):
+    """
+    Attack locations of one country and year, aggregated into grid cells when there are more than max_points.
+    With related=True only attacks belonging to a group of related attacks are included. A bounding box
+    (lat_min, lat_max, lon_min, lon_max, all four or none) restricts the attacks to it; country and year then
+    become optional filters (empty country or year 0 for all)
+    """
+
+    country: str = ""
+    year: int = 0
+    related: bool = False
+    max_points: int = MAX_MAP_POINTS
+    lat_min: typing.Optional[float] = None
+    lat_max: typing.Optional[float] = None
+    lon_min: typing.Optional[float] = None
+    lon_max: typing.Optional[float] = None
+
+    name = "incident_points"
+    result_type = IncidentPoint
+
+    def __post_init__(self):
+        if self.max_points <= 0:
+            raise ValueError("max_points must be positive")
+        bbox = self.bbox()
+        if bbox is None and any(value is not None for value in (self.lat_min, self.lat_max, self.lon_min,
+                                                                 self.lon_max)):
+            raise ValueError("lat_min, lat_max, lon_min and lon_max must be given together")
+        if bbox is not None and (self.lat_min > self.lat_max or self.lon_min > self.lon_max):
+            raise ValueError("lat_min/lon_min must not be greater than lat_max/lon_max")
+
+    def bbox(self):
+        bbox = (self.lat_min, self.lat_max, self.lon_min, self.lon_max)
+        return None if any(value is None for value in bbox) else bbox
+
+    def _points(self, dataset):
+        if self.bbox() is None:
+            partitions = related_partitions(dataset) if self.related else map_partitions(dataset)
+            return partitions.get(self.country, self.year)
+        points = within_bbox(dataset, *self.bbox(), related=self.related)
+        if self.country:
+            points = points[points["country"] == self.country]
+        if self.year:
+            points = points[points["iyear"] == self.year]
+        return points
+
+    def frame(self, dataset):
+        points, aggregated = level_of_detail(self._points(dataset), self.max_points, by="attacktype")
+        if not aggregated:
+            points = points.assign(incidents=1)
+        return points
+
+    def run(self, dataset):
+        return _rows(IncidentPoint, self.frame(dataset), {"label": "tooltip_text"})
+
+
+QUERIES = {query.name: query for query in (TopGroups, EntityCounts, AlternativeCrit, CritMatrix, FatalityRatio,
+                                           IncidentPoints)}
+
+
+def _coerce(field_type, value):
+    if typing.get_origin(field_type) is typing.Union:
+        field_type = next(arg for arg in typing.get_args(field_type) if arg is not type(None))
+    if field_type is bool:
+        if value.lower() not in ("1", "0", "true", "false"):
+            raise ValueError(f"{value!r} is not a boolean")
+        return value.lower() in ("1", "true")
+    return field_type(value)
+
+
+def parse_query(name, params):
+    """
+    Build the query `name` from string parameters (e.g. a URL query string). Raises KeyError for an unknown
+    query and ValueError for unknown or malformed parameters
+    """
+    query_type = QUERIES[name]
+    fields = {field.name: field for field in dataclasses.fields(query_type)}
+    unknown = set(params) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+    return query_type(**{key: _coerce(fields[key].type, value) for key, value in params.items()})
+
+
+def describe():
+    """
+    Every query with its parameters and their defaults
+    """
+    return {name: {field.name: field.default for field in dataclasses.fields(query_type)}
+            for name, query_type in QUERIES.items()}
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+UNKNOWN = "Unknown"
+
+
+class DisjointSet:
+    """
+    Union-find over integer node ids 0..n-1 with union by size and path halving
+    """
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def __len__(self):
+        return len(self.parent)
+
+    def grow(self, n):
+        old = len(self.parent)
+        if n > old:
+            self.parent.extend(range(old, n))
+            self.size.extend([1] * (n - old))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+    def union_all(self, left, right):
+        for a, b in zip(np.asarray(left).tolist(), np.asarray(right).tolist()):
+            self.union(a, b)
+
+    def roots(self):
+        parent = np.asarray(self.parent, dtype=np.int64)
+        # Pointer jumping until every node points directly at its root
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+
+def related_links(frame, id_col="eventid", related_col="related"):
+    """
+    Explode the free-text related column into (eventid, related_eventid) pairs.
+
+    GTD separates ids with "," or ", " (and occasionally other text), so ids are extracted as digit runs rather
+    than split on a fixed separator.
+    """
+    related = frame[related_col]
+    mask = related.notna() & (related != UNKNOWN)
+    ids = related[mask].astype(str).str.extractall(r"(\d+)")[0]
+    rows = ids.index.get_level_values(0)
+    return pd.DataFrame({
+        "eventid": frame.loc[rows, id_col].to_numpy(dtype=np.int64),
+        "related_eventid": ids.to_numpy().astype(np.int64),
+    })
+
+
+def component_keys(eventids, links):
+    """
+    Connected components of the graph formed by `links`, labelled with a stable integer key.
+
+    Keys are assigned in order of each component's smallest eventid, so they do not depend on row order.
+    Returns a Series mapping every node id (including related ids outside the frame) to its key.
+    """
+    nodes = np.unique(np.concatenate([
+        np.asarray(eventids, dtype=np.int64),
+        links["eventid"].to_numpy(),
+        links["related_eventid"].to_numpy(),
+    ]))
+    dsu = DisjointSet(len(nodes))
+    dsu.union_all(np.searchsorted(nodes, links["eventid"].to_numpy()),
+                  np.searchsorted(nodes, links["related_eventid"].to_numpy()))
+    roots = dsu.roots()
+    # nodes are sorted, so the first occurrence of each root is the component's smallest eventid
+    _, first = np.unique(roots, return_index=True)
+    order = np.empty(len(nodes), dtype=np.int64)
+    order[roots[np.sort(first)]] = np.arange(len(first))
+    return pd.Series(order[roots], index=nodes, name="event_key")
+
+
+def stable_keys(eventids, components):
+    """
+    Relabel arbitrary component ids as 0..k-1 in order of each component's smallest eventid in the frame
+    """
+    first = pd.Series(np.asarray(eventids)).groupby(np.asarray(components)).transform("min")
+    return pd.factorize(first, sort=True)[0].astype(np.int64)
+
+
+def group_related(frame, id_col="eventid", related_col="related"):
+    """
+    Rows of `frame` which list related attacks, with an `event_key` identifying their group of related attacks.
+
+    Links are treated as undirected, so asymmetric ("A lists B but B does not list A") and transitive references
+    end up in the same group.
+    """
+    related = frame[related_col]
+    frame_rel = frame[related.notna() & (related != UNKNOWN)].reset_index(drop=True)
+    links = related_links(frame_rel, id_col, related_col)
+    keys = component_keys(frame_rel[id_col], links)
+    components = keys.reindex(frame_rel[id_col].to_numpy()).to_numpy(dtype=np.int64)
+    frame_rel["event_key"] = stable_keys(frame_rel[id_col], components)
+    return frame_rel
+
+
+def event_dates(frame):
+    # GTD uses 0 for an unknown month or day
+    return pd.to_datetime(pd.DataFrame({
+        "year": frame["iyear"],
+        "month": frame["imonth"].clip(lower=1),
+        "day": frame["iday"].clip(lower=1),
+    }), errors="coerce")
+
+
+def group_summary(frame_rel):
+    """
+    Per-group aggregates for the output of group_related(): size, casualties and span of days
+    """
+    grouped = frame_rel.assign(date=event_dates(frame_rel)).groupby("event_key")
+    summary = grouped.agg(group_size=("eventid", "size"),
+                          casualties=("casualties", "sum"),
+                          nkill=("nkill", "sum"),
+                          first_date=("date", "min"),
+                          last_date=("date", "max"))
+    summary["span_days"] = (summary["last_date"] - summary["first_date"]).dt.days
+    return summary
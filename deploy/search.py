@@ -0,0 +1,235 @@
+"""
+Inverted-index search over the free-text fields of the dataset, with facet filters and facet counts.
+
+Every value of the TEXT_FIELDS is split into lowercase alphanumeric tokens, and each "field:token" term maps to the
+sorted rows holding it (its posting list). The postings are persisted next to the dataset as the "search_postings"
+artifact and rebuilt only for a new dataset version. Queries turn posting lists and facet filters into row bitmaps
+and intersect them, so they never scan the text columns:
+
+    python deploy/search.py "taliban police" --country Afghanistan --year 2010
+    python deploy/search.py "gname:lashkar* OR gname:jaish* -police" --attacktype "Bombing/Explosion"
+
+Query syntax: words are ANDed, "a OR b" matches either, a leading "-" excludes, a trailing "*" matches by prefix and
+"field:word" restricts a word to one field (e.g. corp1:police). A word with several tokens ("al-qaida") needs all
+of them.
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrument import traced
+from loader import DATA_PATH, SENTINELS, derived, load_artifact, load_dataset, with_sentinels
+
+TEXT_FIELDS = ["gname", "corp1", "targsubtype", "city", "province", "weapsubtype", "motive"]
+FACETS = ["country", "iyear", "attacktype"]
+HIT_COLUMNS = ["eventid", "iyear", "country", "province", "city", "attacktype", "gname", "corp1", "targsubtype",
+               "weapsubtype", "casualties"]
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(str(text).lower())
+
+
+def build_postings(frame):
+    """
+    (term, row) pairs sorted by term and row, where term is "field:token" and row a position in `frame`.
+
+    Text columns are dictionary encoded, so every distinct value is tokenized once and its tokens are joined to
+    the rows of that value through the category codes.
+    """
+    pieces = []
+    for field in TEXT_FIELDS:
+        if field not in frame.columns:
+            continue
+        values = frame[field].astype("category")
+        sentinel = SENTINELS.get(field)
+        if sentinel is not None and values.isna().any():
+            # Missing values are searchable under their placeholder, e.g. gname:unknown
+            if sentinel not in values.cat.categories:
+                values = values.cat.add_categories(sentinel)
+            values = values.fillna(sentinel)
+        term_codes = [(f"{field}:{token}", code)
+                      for code, value in enumerate(values.cat.categories)
+                      for token in set(tokenize(value))]
+        if not term_codes:
+            continue
+        terms = pd.DataFrame(term_codes, columns=["term", "code"])
+        rows = pd.DataFrame({"code": values.cat.codes.to_numpy(), "row": np.arange(len(frame), dtype=np.int32)})
+        pieces.append(rows.merge(terms, on="code")[["term", "row"]])
+
+    if not pieces:
+        return pd.DataFrame({"term": pd.Series(dtype="category"), "row": pd.Series(dtype=np.int32)})
+    postings = pd.concat(pieces, ignore_index=True)
+    postings["term"] = postings["term"].astype("category")
+    return postings.sort_values(["term", "row"], ignore_index=True)
+
+
+class SearchIndex:
+    """
+    Term dictionary over the persisted postings: terms are sorted, so a term or a prefix is a binary search and its
+    posting lists are one contiguous slice of `rows`
+    """
+
+    def __init__(self, postings, n_rows):
+        self.n_rows = n_rows
+        terms = postings["term"].astype("category")
+        # Categories are sorted and the postings are sorted by term, so codes are ascending
+        codes = terms.cat.codes.to_numpy()
+        self.terms = terms.cat.categories.to_numpy(dtype=object)
+        self.starts = np.searchsorted(codes, np.arange(len(self.terms) + 1))
+        self.rows = postings["row"].to_numpy()
+        self.fields = sorted({term.split(":", 1)[0] for term in self.terms})
+
+    def _term_range(self, term, prefix=False):
+        lo = np.searchsorted(self.terms, term, side="left")
+        hi = np.searchsorted(self.terms, term + "\uffff" if prefix else term, side="right")
+        return self.starts[lo], self.starts[hi]
+
+    def bitmap(self, fields, token, prefix=False):
+        """
+        Rows whose value of any of `fields` has `token` (or a token starting with it) as a boolean mask
+        """
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for field in fields:
+            start, stop = self._term_range(f"{field}:{token}", prefix)
+            mask[self.rows[start:stop]] = True
+        return mask
+
+
+def search_index(dataset):
+    return derived(dataset, "search_index",
+                   lambda ds: SearchIndex(load_artifact(ds, "search_postings", build_postings), len(ds.frame)))
+
+
+def parse(text):
+    """
+    Clauses of a query: a list of (negated, alternatives), each alternative a (field, tokens, prefix) word
+    """
+    clauses = []
+    pending_or = False
+    for word in text.split():
+        if word == "OR":
+            pending_or = bool(clauses)
+            continue
+        negated = word.startswith("-") and len(word) > 1
+        word = word[1:] if negated else word
+        field, _, body = word.rpartition(":") if ":" in word else (None, None, word)
+        prefix = body.endswith("*")
+        tokens = tokenize(body)
+        if not tokens:
+            continue
+        alternative = (field or None, tokens, prefix)
+        if pending_or and not negated and not clauses[-1][0]:
+            clauses[-1][1].append(alternative)
+        else:
+            clauses.append((negated, [alternative]))
+        pending_or = False
+    return clauses
+
+
+def _facet_mask(frame, filters):
+    mask = np.ones(len(frame), dtype=bool)
+    for col, value in filters.items():
+        if value is None or (isinstance(value, (list, tuple, set)) and not value):
+            continue
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        mask &= frame[col].isin(values).to_numpy()
+    return mask
+
+
+def facet_counts(frame, mask, col):
+    """
+    Value counts of `col` over the rows selected by `mask`, largest first
+    """
+    values = frame[col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()[mask]
+        counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+        labels = values.cat.categories.to_numpy()
+    else:
+        labels, counts = np.unique(values.to_numpy()[mask], return_counts=True)
+    found = counts > 0
+    result = pd.DataFrame({col: labels[found], "count": counts[found]})
+    return result.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+
+
+@traced("facet_values")
+def facet_values(dataset):
+    """
+    Every value of each facet, sorted, e.g. for the options of facet filters
+    """
+    def build(ds):
+        everything = np.ones(len(ds.frame), dtype=bool)
+        return {col: sorted(facet_counts(ds.frame, everything, col)[col].tolist())
+                for col in FACETS if col in ds.frame.columns}
+
+    return derived(dataset, "search_facet_values", build)
+
+
+class SearchResult:
+    def __init__(self, hits, total, facets, seconds):
+        self.hits = hits
+        self.total = total
+        self.facets = facets
+        self.seconds = seconds
+
+
+@traced("search", rows=lambda result: result.total)
+def search(dataset, text="", limit=100, **filters):
+    """
+    Rows of the dataset matching the query `text` and the facet filters (e.g. country="India" or
+    iyear=[2010, 2011]). Returns the first `limit` hits, the total number of hits and the counts of every facet
+    over all hits
+    """
+    unknown = set(filters) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown facets: {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    frame = dataset.frame
+    index = search_index(dataset)
+    mask = _facet_mask(frame, filters)
+    for negated, alternatives in parse(text):
+        matched = np.zeros(len(frame), dtype=bool)
+        for field, tokens, prefix in alternatives:
+            fields = [field] if field else index.fields
+            word = np.ones(len(frame), dtype=bool)
+            for i, token in enumerate(tokens):
+                # Only the last token of a word is a prefix ("al-qa*" is al AND qa*)
+                word &= index.bitmap(fields, token, prefix and i == len(tokens) - 1)
+            matched |= word
+        mask &= ~matched if negated else matched
+
+    rows = np.flatnonzero(mask)
+    columns = [col for col in HIT_COLUMNS if col in frame.columns]
+    hits = with_sentinels(frame.iloc[rows[:limit]][columns])
+    facets = {col: facet_counts(frame, mask, col) for col in FACETS if col in frame.columns}
+    return SearchResult(hits.reset_index(drop=True), len(rows), facets, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the dataset's text fields")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--country", action="append")
+    parser.add_argument("--year", action="append", type=int)
+    parser.add_argument("--attacktype", action="append")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.data)
+    result = search(dataset, args.query, args.limit, country=args.country, iyear=args.year,
+                    attacktype=args.attacktype)
+    print(f"{result.total} hits in {result.seconds * 1000:.1f}ms")
+    print(result.hits.to_string(index=False))
+    for col, counts in result.facets.items():
+        print(f"\n{counts.head(10).to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+HTTP/JSON front end of queries.py, so other tools can fetch the dashboard's numbers without rendering anything:
+
+    python deploy/server.py --data data/combined_data.csv --port 8600
+    curl "localhost:8600/queries/top_groups?n=5"
+
+    GET /health                       dataset version and row count
+    GET /queries                      the available queries and their parameters (with defaults)
+    GET /queries/<name>?param=value   {"query", "params", "dataset_version", "rows"}
+
+Encoded responses are kept in a bounded LRU cache keyed on the query, its parameters and the dataset version, so a
+new dataset release never serves stale results. Every response carries an ETag derived from the same key; a request
+whose If-None-Match matches gets 304 Not Modified without the query being run. Requests are handled by a fixed pool
+of worker threads. A worker is only taken while a request is being read and answered: idle keep-alive connections
+wait in a selector (and are closed after KEEPALIVE_SECONDS), and a client stalling in the middle of a request is
+dropped after REQUEST_TIMEOUT seconds.
+"""
+import argparse
+import dataclasses
+import hashlib
+import json
+import math
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from figcache import FigureCache
+from instrument import span
+from loader import DATA_PATH, load_dataset
+from queries import describe, parse_query
+
+DEFAULT_WORKERS = 8
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+REQUEST_TIMEOUT = 10
+KEEPALIVE_SECONDS = 60
+
+
+def _clean(value):
+    # JSON has no NaN
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def encode(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def run_query(dataset, query):
+    with span("query." + query.name) as current:
+        rows = query.run(dataset)
+        current.rows = len(rows)
+    return encode({
+        "query": query.name,
+        "params": query.params(),
+        "dataset_version": dataset.version,
+        "rows": [{key: _clean(value) for key, value in dataclasses.asdict(row).items()} for row in rows],
+    })
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    One client connection. QueryServer calls handle_one_request() whenever a request arrives on it, instead of the
+    handler looping over the requests of the connection on one thread
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+
+    def __init__(self, request, client_address, server):
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.close_connection = True
+        self.setup()
+
+    def has_buffered_request(self):
+        """
+        Whether (part of) another request has already arrived, e.g. one pipelined behind the previous request
+        """
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _send(self, status, body=b"", etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, encode({"error": message}))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        dataset = load_dataset(self.server.data_path)
+
+        if parts == ["health"]:
+            return self._send(HTTPStatus.OK, encode({"dataset_version": dataset.version,
+                                                     "rows": len(dataset.frame)}))
+        if parts == ["queries"]:
+            return self._send(HTTPStatus.OK, encode(describe()))
+        if len(parts) != 2 or parts[0] != "queries":
+            return self._error(HTTPStatus.NOT_FOUND, f"No such resource {url.path}")
+
+        try:
+            query = parse_query(parts[1], dict(parse_qsl(url.query)))
+        except KeyError:
+            return self._error(HTTPStatus.NOT_FOUND, f"No such query {parts[1]}")
+        except (TypeError, ValueError) as exc:
+            return self._error(HTTPStatus.BAD_REQUEST, str(exc))
+
+        key = (query.name, tuple(sorted(query.params().items())), dataset.version)
+        etag = '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + '"'
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            return self._send(HTTPStatus.NOT_MODIFIED, etag=etag)
+        body = self.server.cache.get_or_render(key, lambda: run_query(dataset, query))
+        self._send(HTTPStatus.OK, body, etag)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class QueryServer(HTTPServer):
+    """
+    HTTPServer handing every request to a fixed-size thread pool instead of a new thread per connection. Between
+    requests, keep-alive connections wait in a selector watched by one thread, so idle clients hold no worker
+    """
+
+    def __init__(self, address, data_path=DATA_PATH, workers=DEFAULT_WORKERS, cache_bytes=DEFAULT_CACHE_BYTES,
+                 quiet=False):
+        super().__init__(address, QueryHandler)
+        self.data_path = data_path
+        self.cache = FigureCache(cache_bytes)
+        self.quiet = quiet
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        self._idle = selectors.DefaultSelector()
+        self._waiting = deque()
+        self._wakeup, self._wakeup_sender = socket.socketpair()
+        self._idle.register(self._wakeup, selectors.EVENT_READ)
+        self._closed = False
+        self._watcher = threading.Thread(target=self._watch, name="query-idle", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        self._wait(QueryHandler(request, client_address, self))
+
+    def _wait(self, handler):
+        if self._closed:
+            return self._close(handler)
+        self._waiting.append(handler)
+        self._wakeup_sender.send(b"\0")
+
+    def _watch(self):
+        """
+        Hand connections with a request arriving to the pool, and close those idle for KEEPALIVE_SECONDS
+        """
+        while not self._closed:
+            now = time.monotonic()
+            while self._waiting:
+                handler = self._waiting.popleft()
+                self._idle.register(handler.connection, selectors.EVENT_READ, (handler, now + KEEPALIVE_SECONDS))
+            for key, _ in self._idle.select(timeout=1):
+                if key.fileobj is self._wakeup:
+                    self._wakeup.recv(4096)
+                    continue
+                self._idle.unregister(key.fileobj)
+                self.pool.submit(self._process, key.data[0])
+            for key in list(self._idle.get_map().values()):
+                if key.data is not None and key.data[1] < now:
+                    self._idle.unregister(key.fileobj)
+                    self._close(key.data[0])
+
+    def _process(self, handler):
+        try:
+            handler.handle_one_request()
+            while not handler.close_connection and handler.has_buffered_request():
+                handler.handle_one_request()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            handler.close_connection = True
+        if handler.close_connection:
+            self._close(handler)
+        else:
+            self._wait(handler)
+
+    def _close(self, handler):
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+        super().server_close()
+        self._closed = True
+        self._wakeup_sender.send(b"\0")
+        self._watcher.join()
+        self.pool.shutdown(wait=True)
+        for key in list(self._idle.get_map().values()):
+            if key.data is not None:
+                self._close(key.data[0])
+        while self._waiting:
+            self._close(self._waiting.popleft())
+        self._idle.close()
+        self._wakeup.close()
+        self._wakeup_sender.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard's analyses as JSON")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--cache-bytes", type=int, default=DEFAULT_CACHE_BYTES)
+    parser.add_argument("--quiet", action="store_true", help="do not log every request")
+    args = parser.parse_args()
+
+    # Load (and snapshot) the dataset before accepting requests
+    load_dataset(args.data)
+    server = QueryServer((args.host, args.port), args.data, args.workers, args.cache_bytes, args.quiet)
+    print(f"Serving queries on http://{args.host}:{args.port}/queries")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
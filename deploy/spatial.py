@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from loader import derived
+from partitions import map_partitions, related_partitions, tooltip_text
+
+MAX_MAP_POINTS = 2000
+BASE_CELL_DEG = 0.05
+# The `by` value of cells that mix incidents of several values (see level_of_detail)
+MIXED = "Mixed"
+
+
+def grid_bin(frame, cell_deg, by=None):
+    """
+    Aggregate points into cell_deg x cell_deg latitude/longitude cells.
+
+    Each cell reports its incident count, summed casualties and the mean position of its incidents, so cells are
+    drawn where the attacks actually are rather than at the grid corner. With `by`, cells are split per value of
+    that column (e.g. attacktype) so the maps can keep colouring by it.
+    """
+    # Offset to the south-west corner of the globe, so that a cell of 360 degrees or more holds every point
+    keys = [np.floor((frame["latitude"].to_numpy() + 90) / cell_deg).astype(np.int64),
+            np.floor((frame["longitude"].to_numpy() + 180) / cell_deg).astype(np.int64)]
+    names = ["lat_cell", "lon_cell"]
+    if by is not None:
+        keys.append(frame[by].to_numpy())
+        names.append(by)
+
+    binned = pd.DataFrame(dict(zip(names, keys)))
+    binned["latitude"] = frame["latitude"].to_numpy()
+    binned["longitude"] = frame["longitude"].to_numpy()
+    binned["casualties"] = frame["casualties"].to_numpy()
+    cells = binned.groupby(names, observed=True, sort=False).agg(
+        incidents=("casualties", "size"),
+        casualties=("casualties", "sum"),
+        latitude=("latitude", "mean"),
+        longitude=("longitude", "mean"),
+    ).reset_index()
+    cells["tooltip_text"] = cells["incidents"].astype(str) + " incidents"
+    return cells.drop(columns=["lat_cell", "lon_cell"])
+
+
+def level_of_detail(frame, max_points=MAX_MAP_POINTS, by=None):
+    """
+    Raw points when there are at most max_points of them, otherwise grid cells coarse enough to stay within it.
+
+    Returns (frame, aggregated), both with a tooltip_text column. The cell size doubles until the number of cells
+    fits, so the payload sent to the browser is bounded however many incidents the selection holds. With `by`,
+    cells are split per value as long as one cell per value fits; past that they are binned without it and their
+    `by` column is MIXED.
+    """
+    if len(frame) <= max_points:
+        return frame.assign(tooltip_text=tooltip_text(frame)), False
+    cells = _fit_cells(frame, max_points, by)
+    if len(cells) > max_points:
+        cells = _fit_cells(frame, max_points).assign(**{by: MIXED})
+    return cells, True
+
+
+def _fit_cells(frame, max_points, by=None):
+    cell_deg = BASE_CELL_DEG
+    cells = grid_bin(frame, cell_deg, by)
+    while len(cells) > max_points and cell_deg < 360:
+        cell_deg *= 2
+        cells = grid_bin(frame, cell_deg, by)
+    return cells
+
+
+class GridIndex:
+    """
+    Uniform-grid spatial index over latitude/longitude for bounding-box queries.
+
+    Rows are bucketed by cell and sorted by cell id (row-major), so the cells of one grid row inside a bounding
+    box are a single contiguous range and a query touches only the candidate rows of the cells it overlaps.
+    """
+
+    def __init__(self, latitude, longitude, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.n_cols = int(np.ceil(360 / cell_deg)) + 1
+
+        cell_ids = self._cell_ids(self.latitude, self.longitude)
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.sorted_ids = cell_ids[self.order]
+
+    def _rows(self, latitude):
+        return np.floor((np.asarray(latitude) + 90) / self.cell_deg).astype(np.int64)
+
+    def _cols(self, longitude):
+        return np.floor((np.asarray(longitude) + 180) / self.cell_deg).astype(np.int64)
+
+    def _cell_ids(self, latitude, longitude):
+        return self._rows(latitude) * self.n_cols + self._cols(longitude)
+
+    def query(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Row positions (into the indexed arrays) of the points inside the bounding box, in ascending order
+        """
+        col_lo, col_hi = int(self._cols(lon_min)), int(self._cols(lon_max))
+        candidates = []
+        for row in range(int(self._rows(lat_min)), int(self._rows(lat_max)) + 1):
+            start = np.searchsorted(self.sorted_ids, row * self.n_cols + col_lo, side="left")
+            stop = np.searchsorted(self.sorted_ids, row * self.n_cols + col_hi, side="right")
+            candidates.append(self.order[start:stop])
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(candidates)
+        lat, lon = self.latitude[rows], self.longitude[rows]
+        inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+        return np.sort(rows[inside])
+
+
+def map_spatial_index(dataset, related=False):
+    """
+    GridIndex over the map frame, or over the frame of related attacks with related=True
+    """
+    partitions = related_partitions if related else map_partitions
+
+    def build(ds):
+        frame = partitions(ds).frame
+        return GridIndex(frame["latitude"], frame["longitude"])
+
+    return derived(dataset, "related_spatial_index" if related else "map_spatial_index", build)
+
+
+def within_bbox(dataset, lat_min, lat_max, lon_min, lon_max, related=False):
+    """
+    Map rows of the dataset inside the bounding box (of the related attacks with related=True)
+    """
+    frame = (related_partitions if related else map_partitions)(dataset).frame
+    return frame.iloc[map_spatial_index(dataset, related).query(lat_min, lat_max, lon_min, lon_max)]
@@ -0,0 +1,208 @@
+"""
+Synthetic events with the combined_data.csv schema, for benchmarking at sizes well beyond the South Asia slice.
+
+The distributions follow the real data closely enough for the pipeline to do representative work: a few perpetrator
+groups (and "Unknown") account for most attacks with a long tail of small ones, attacks cluster around cities,
+activity grows over the years, a share of events belongs to chains of related attacks and the doubtterr/crit flags
+are mixed in roughly GTD proportions:
+
+    python deploy/synth.py --rows 1000000 --out data/synthetic_1m.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from loader import UNKNOWN
+
+# name: (latitude, longitude, share of events)
+COUNTRIES = {
+    "Afghanistan": (34.0, 66.0, 0.30),
+    "Pakistan": (30.0, 70.0, 0.30),
+    "India": (22.0, 79.0, 0.25),
+    "Bangladesh": (23.7, 90.3, 0.05),
+    "Sri Lanka": (7.8, 80.7, 0.05),
+    "Nepal": (28.3, 84.1, 0.04),
+    "Bhutan": (27.5, 90.4, 0.005),
+    "Maldives": (3.2, 73.2, 0.005),
+}
+CITIES_PER_COUNTRY = 200
+
+ATTACK_TYPES = {
+    "Bombing/Explosion": 0.45, "Armed Assault": 0.25, "Assassination": 0.08, "Hostage Taking (Kidnapping)": 0.08,
+    "Facility/Infrastructure Attack": 0.07, "Unknown": 0.04, "Unarmed Assault": 0.01, "Hijacking": 0.01,
+    "Hostage Taking (Barricade Incident)": 0.01,
+}
+WEAPON_TYPES = {
+    "Explosives": 0.48, "Firearms": 0.35, "Unknown": 0.08, "Incendiary": 0.05, "Melee": 0.02, "Vehicles": 0.01,
+    "Chemical": 0.005, "Other": 0.005,
+}
+TARGET_TYPES = {
+    "Private Citizens & Property": 0.26, "Police": 0.18, "Government (General)": 0.14, "Military": 0.12,
+    "Business": 0.07, "Educational Institution": 0.05, "Religious Figures/Institutions": 0.04, "Transportation": 0.04,
+    "Utilities": 0.03, "Unknown": 0.03, "Terrorists/Non-State Militia": 0.02, "Other": 0.02,
+}
+ALTERNATIVES = {
+    "Insurgency/Guerilla Action": 0.7, "Other Crime Type": 0.12, "Intra/Inter-group Conflict": 0.1,
+    "Lack of Intentionality": 0.05, "State Actors": 0.03,
+}
+
+RELATED_SHARE = 0.08
+GROUP_EXPONENT = 1.3
+
+
+def _choice(rng, weights, n):
+    names = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=np.float64)
+    return names[rng.choice(len(names), size=n, p=p / p.sum())]
+
+
+def _counts(rng, n, mean, dispersion=0.5):
+    # Negative binomial: mostly 0-2 with a long tail of mass-casualty attacks
+    return rng.negative_binomial(dispersion, dispersion / (dispersion + mean), size=n).astype(np.float64)
+
+
+def group_names(rng, n):
+    """
+    Perpetrator names with Zipf-like frequencies. The number of groups grows with the number of events
+    """
+    n_groups = max(20, int(np.sqrt(n) * 2))
+    ranks = np.arange(1, n_groups + 1, dtype=np.float64)
+    p = ranks ** -GROUP_EXPONENT
+    p = p / p.sum() * 0.6
+    names = np.array([f"Group {i}" for i in range(n_groups)], dtype=object)
+    gname = names[rng.choice(n_groups, size=n, p=p / p.sum())]
+    gname[rng.random(n) < 0.4] = UNKNOWN
+    return gname
+
+
+def event_ids(rng, n):
+    """
+    Unique GTD-style ids (yyyymmdd followed by a 4 digit sequence number) with activity growing over the years
+    """
+    years = np.arange(1970, 2021)
+    weights = np.linspace(1, 12, len(years)) ** 1.5
+    year = rng.choice(years, size=n, p=weights / weights.sum())
+    month = rng.integers(1, 13, size=n)
+    day = rng.integers(1, 29, size=n)
+    date = year * 10000 + month * 100 + day
+    order = np.argsort(date, kind="stable")
+    date = date[order]
+    # Sequence number within the day
+    first = np.r_[0, np.flatnonzero(np.diff(date)) + 1]
+    seq = np.arange(n) - np.repeat(first, np.diff(np.r_[first, n]))
+    return date * 10000 + seq % 10000
+
+
+def related_chains(rng, eventids):
+    """
+    The related column: chains of 2-6 attacks close in time that list each other, a few also referring to an
+    event outside the data
+    """
+    n = len(eventids)
+    related = np.full(n, UNKNOWN, dtype=object)
+    members = np.sort(rng.choice(n, size=int(n * RELATED_SHARE), replace=False))
+    lengths = rng.integers(2, 7, size=len(members) // 2)
+    bounds = np.cumsum(lengths)
+    bounds = bounds[bounds < len(members)]
+    for chain in np.split(members, bounds):
+        if len(chain) < 2:
+            continue
+        ids = [str(eid) for eid in eventids[chain]]
+        if rng.random() < 0.1:
+            ids.append(str(eventids[chain[0]] + 9999))
+        for pos, row in enumerate(chain):
+            related[row] = ", ".join(ids[:pos] + ids[pos + 1:])
+    return related
+
+
+def generate(n, seed=0):
+    """
+    A frame of n synthetic events with the columns (and column order) of combined_data.csv
+    """
+    rng = np.random.default_rng(seed)
+    eventids = event_ids(rng, n)
+    iyear = eventids // 100000000
+
+    country = _choice(rng, {name: share for name, (_, _, share) in COUNTRIES.items()}, n)
+    centers = pd.DataFrame.from_dict(COUNTRIES, orient="index", columns=["latitude", "longitude", "share"])
+    # Attacks concentrate in a few cities of each country
+    city_rank = np.minimum(rng.zipf(1.6, size=n), CITIES_PER_COUNTRY) - 1
+    city_offset = np.random.default_rng(seed + 1).normal(0, 2.0, size=(CITIES_PER_COUNTRY, 2))
+    latitude = centers["latitude"].reindex(country).to_numpy() + city_offset[city_rank, 0] + rng.normal(0, 0.05, n)
+    longitude = centers["longitude"].reindex(country).to_numpy() + city_offset[city_rank, 1] + rng.normal(0, 0.05, n)
+    country_names = pd.Series(country)
+    city = (country_names.str.slice(0, 3) + " City " + pd.Series(city_rank).astype(str)).to_numpy(dtype=object)
+    city[rng.random(n) < 0.03] = UNKNOWN
+    province = country_names + " Province " + pd.Series(city_rank % 12).astype(str)
+
+    doubtterr = rng.choice([0, 1, -9], size=n, p=[0.78, 0.2, 0.02])
+    alternative_type = np.where(doubtterr == 1, _choice(rng, ALTERNATIVES, n), UNKNOWN)
+    codes = {name: str(code) for code, name in enumerate(ALTERNATIVES, start=1)}
+    alternative = pd.Series(alternative_type).map(codes).fillna(UNKNOWN)
+    weaptype = pd.Series(_choice(rng, WEAPON_TYPES, n))
+    weapsubtype = weaptype + " (" + pd.Series(rng.integers(0, 6, n)).astype(str) + ")"
+    weapsubtype = weapsubtype.where(weaptype != UNKNOWN, UNKNOWN)
+    corp1 = ("Organization " + pd.Series(rng.integers(0, 5000, n)).astype(str)).where(rng.random(n) >= 0.3, UNKNOWN)
+
+    nkill = _counts(rng, n, 2.4)
+    nwound = _counts(rng, n, 3.5)
+    frame = pd.DataFrame({
+        "attacktype": _choice(rng, ATTACK_TYPES, n),
+        "success": (rng.random(n) < 0.88).astype(np.int64),
+        "suicide": (rng.random(n) < 0.05).astype(np.int64),
+        "nkill": nkill,
+        "nkillter": _counts(rng, n, 0.3),
+        "nwound": nwound,
+        "nwoundte": _counts(rng, n, 0.05),
+        "property": rng.choice([0, 1, -9], size=n, p=[0.45, 0.45, 0.1]),
+        "ishostkid": rng.choice([0, 1, -9], size=n, p=[0.9, 0.08, 0.02]),
+        "eventid": eventids,
+        "iyear": iyear,
+        "imonth": eventids // 1000000 % 100,
+        "iday": eventids // 10000 % 100,
+        "approxdate": np.nan,
+        "extended": (rng.random(n) < 0.05).astype(np.int64),
+        "resolution": np.nan,
+        "crit1": (rng.random(n) < 0.99).astype(np.int64),
+        "crit2": (rng.random(n) < 0.99).astype(np.int64),
+        "crit3": (rng.random(n) < 0.87).astype(np.int64),
+        "doubtterr": doubtterr,
+        "alternative": alternative,
+        "alternative_attack_type": alternative_type,
+        "multiple": 0,
+        "related": related_chains(rng, eventids),
+        "country": country,
+        "province": province,
+        "city": city,
+        "vicinity": (rng.random(n) < 0.07).astype(np.int64),
+        "latitude": latitude,
+        "longitude": longitude,
+        "gname": group_names(rng, n),
+        "nperpcap": np.where(rng.random(n) < 0.9, -99.0, rng.integers(0, 5, size=n)),
+        "nperps": np.where(rng.random(n) < 0.85, -99.0, rng.integers(1, 20, size=n)),
+        "targettype": _choice(rng, TARGET_TYPES, n),
+        "targsubtype": np.nan,
+        "corp1": corp1,
+        "nationality": country,
+        "weaptype": weaptype,
+        "weapsubtype": weapsubtype,
+        "casualties": nkill + nwound,
+    })
+    frame["multiple"] = (frame["related"] != UNKNOWN).astype(np.int64)
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset with the combined_data.csv schema")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="data/synthetic.csv")
+    args = parser.parse_args()
+
+    generate(args.rows, args.seed).to_csv(args.out, index=False)
+    print(f"Wrote {args.rows} events to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The deploy modules import each other as top-level modules, like when running `streamlit run deploy/app.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "deploy"))
+
+from synth import generate  # noqa: E402
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """
+    A small synthetic combined_data.csv in a fresh directory, so that snapshots and artifacts start from nothing
+    """
+    path = tmp_path / "combined_data.csv"
+    generate(2000).to_csv(path, index=False)
+    return str(path)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+import clustering
+import loader
+from loader import load_dataset, read_manifest
+
+
+@pytest.mark.parametrize("eps_km", [10, 25])
+def test_dbscan_on_grid_matches_dbscan_on_points(data_path, eps_km):
+    coords = clustering.location_radians(load_dataset(data_path).frame)
+    clustering._init_worker({"coords": coords, "features": None, "weights": None})
+    labels = clustering._fit("dbscan", {"eps_km": eps_km, "min_samples": 10})
+
+    exact = DBSCAN(eps=eps_km / clustering.EARTH_RADIUS_KM, min_samples=10, metric="haversine",
+                   algorithm="ball_tree").fit_predict(coords)
+    assert adjusted_rand_score(exact, labels) > 0.99
+    np.testing.assert_array_equal(labels < 0, exact < 0)
+
+
+def test_grid_representatives():
+    coords = np.radians([[10.0, 20.0], [10.001, 20.001], [11.0, 20.0]])
+    representatives, counts, inverse = clustering.grid_representatives(coords, 10.0)
+    assert sorted(counts) == [1, 2]
+    assert inverse[0] == inverse[1] != inverse[2]
+    np.testing.assert_allclose(representatives[inverse[0]], coords[:2].mean(axis=0))
+
+
+def test_connectivity_graph_is_versioned_in_manifest(data_path, monkeypatch):
+    dataset = load_dataset(data_path)
+    features = clustering.build_features(dataset.frame)
+    graph = clustering.connectivity_graph(dataset, features)
+    name = f"knn_graph_{clustering.CONNECTIVITY_NEIGHBORS}.npz"
+    assert read_manifest(dataset.source)["artifacts"][name]["version"] == dataset.version
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the cached graph should be read back")
+
+    monkeypatch.setattr(clustering, "kneighbors_graph", fail)
+    loader.clear_cache()
+    cached = clustering.connectivity_graph(load_dataset(data_path), features)
+    assert (cached != graph).nnz == 0
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import etl
+
+
+def raw_export(**columns):
+    """
+    A raw GTD export of South Asian events with every RAW_DTYPES column, overridden by `columns`
+    """
+    n = len(next(iter(columns.values())))
+    frame = pd.DataFrame({col: np.zeros(n, dtype=np.int64) if dtype == "int64"
+                          else np.full(n, np.nan if dtype == "float64" else None, dtype=object)
+                          for col, dtype in etl.RAW_DTYPES.items()})
+    frame["eventid"] = 201001010000 + np.arange(n)
+    frame["iyear"] = 2010
+    frame["region_txt"] = "South Asia"
+    frame["country_txt"] = "India"
+    frame[["crit1", "crit2", "crit3", "doubtterr", "multiple"]] = 1
+    frame["latitude"], frame["longitude"] = 20.0, 78.0
+    for col in ["attacktype1_txt", "targtype1_txt", "weaptype1_txt", "gname"]:
+        frame[col] = "x"
+    frame[["nkill", "nkillter", "nwound", "nwoundte", "property", "ishostkid"]] = 0
+    for col, values in columns.items():
+        frame[col] = values
+    return frame
+
+
+def run(tmp_path, raw, **kwargs):
+    source = tmp_path / "terrorism.csv"
+    raw.to_csv(source, index=False, encoding="latin-1")
+    out_dir = tmp_path / "tables"
+    rows = etl.run(str(source), str(out_dir), chunksize=2, **kwargs)
+    return rows, {name: pd.read_csv(out_dir / (name + ".csv")) for name in etl.TABLE_FILES}
+
+
+def test_corp_coalescing(tmp_path):
+    raw = raw_export(corp1=["A", None, "A", None, "A"],
+                     corp2=["B", "B", "A", None, None],
+                     corp3=["C", None, None, None, "C"])
+    _, tables = run(tmp_path, raw)
+    assert tables["target"]["corp1"].tolist() == ["A,B,C", "B", "A", "Unknown", "A,C"]
+
+
+def test_sentinels(tmp_path):
+    raw = raw_export(nperps=[np.nan, 3], nperpcap=[np.nan, 0], natlty1_txt=[None, "India"], city=[None, "Delhi"],
+                     alternative=[np.nan, 2.0], alternative_txt=[None, "Insurgency"], related=[None, "1, 2"],
+                     doubtterr=[np.nan, 0], multiple=[np.nan, 1])
+    _, tables = run(tmp_path, raw)
+    perpetrator, target, location, incident = (tables[name] for name in ["perpetrator", "target", "location",
+                                                                         "incident"])
+    assert perpetrator[["nperps", "nperpcap"]].values.tolist() == [[-99, -99], [3, 0]]
+    assert target["nationality"].tolist() == ["Unknown", "India"]
+    assert location["city"].tolist() == ["Unknown", "Delhi"]
+    assert incident["alternative"].astype(str).tolist() == ["Unknown", "2"]
+    assert incident["alternative_attack_type"].tolist() == ["Unknown", "Insurgency"]
+    assert incident["related"].tolist() == ["Unknown", "1, 2"]
+    assert incident["doubtterr"].tolist() == [etl.DOUBT_UNKNOWN, 0]
+    assert incident["multiple"].isna().tolist() == [True, False]
+
+
+def test_weapon_normalization(tmp_path):
+    raw = raw_export(weaptype1_txt=[etl.VEHICLE_WEAPON, " Firearms ", "Explosives"],
+                     weapsubtype1_txt=["Car ", None, "Grenade"])
+    _, tables = run(tmp_path, raw)
+    assert tables["weapon"]["weaptype"].tolist() == ["Vehicles", "Firearms", "Explosives"]
+    assert tables["weapon"]["weapsubtype"].tolist() == ["Car", "Unknown", "Grenade"]
+
+
+def test_casualties_imputed_with_mode_across_chunks(tmp_path):
+    # With chunks of two rows the first chunk's most frequent value is 5, the overall one is 3
+    raw = raw_export(nkill=[5, 5, 3, np.nan, 3, 4, 3, np.nan])
+    _, tables = run(tmp_path, raw)
+    assert tables["casualties"]["nkill"].tolist() == [5, 5, 3, 3, 3, 4, 3, 3]
+
+
+def test_region_filter_and_duplicates(tmp_path):
+    raw = raw_export(region_txt=["South Asia", "Western Europe", "South Asia", "South Asia"])
+    raw.loc[3, "eventid"] = raw.loc[0, "eventid"]
+    rows, tables = run(tmp_path, raw)
+    assert rows == 2
+    assert tables["event"]["eventid"].tolist() == raw["eventid"].iloc[[0, 2]].tolist()
+
+
+def test_no_matching_events_keeps_previous_tables(tmp_path):
+    raw = raw_export(nkill=[1, 2, 3])
+    run(tmp_path, raw)
+    with pytest.raises(ValueError, match="Nowhere"):
+        run(tmp_path, raw, region="Nowhere")
+    assert sorted(os.listdir(tmp_path / "tables")) == sorted(name + ".csv" for name in etl.TABLE_FILES)
+    assert len(etl.combine(str(tmp_path / "tables"))) == 3
@@ -0,0 +1,56 @@
+import os
+import time
+
+from figcache import TEMP_PREFIX, FigureCache
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = FigureCache(max_bytes=30)
+    for key in "abc":
+        cache.put(key, b"x" * 10)
+    cache.get("a")
+    cache.put("d", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"x" * 10
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    cache = FigureCache(max_bytes=1000, disk_dir=str(tmp_path), max_disk_bytes=30)
+    for i, key in enumerate("abcde"):
+        cache.put(key, bytes([i]) * 10)
+    assert cache.stats()["disk_bytes"] == 30
+    assert sum(entry.stat().st_size for entry in os.scandir(tmp_path)) == 30
+
+    restarted = FigureCache(max_bytes=1000, disk_dir=str(tmp_path), max_disk_bytes=30)
+    assert restarted.get("a") is None
+    assert restarted.get("e") == bytes([4]) * 10
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_oldest_read_first(tmp_path):
+    cache = FigureCache(max_bytes=1000, disk_dir=str(tmp_path))
+    for key in "abc":
+        cache.put(key, b"x" * 10)
+    past = time.time() - 60
+    for i, key in enumerate("abc"):
+        os.utime(cache._disk_path(key), (past + i, past + i))
+
+    restarted = FigureCache(max_bytes=1000, disk_dir=str(tmp_path), max_disk_bytes=30)
+    assert restarted.get("a") is not None
+    restarted.put("d", b"x" * 10)
+    assert restarted.stats()["disk_evictions"] == 1
+
+    fresh = FigureCache(disk_dir=str(tmp_path))
+    assert fresh.get("b") is None
+    assert all(fresh.get(key) is not None for key in "acd")
+
+
+def test_disk_writes_leave_no_temp_files(tmp_path):
+    (tmp_path / (TEMP_PREFIX + "stale")).write_bytes(b"partial")
+    cache = FigureCache(disk_dir=str(tmp_path))
+    cache.put(("png", "chart", (), "v1"), b"payload")
+    cache.put(("png", "chart", (), "v1"), b"payload2")
+    names = os.listdir(tmp_path)
+    assert len(names) == 1 and not names[0].startswith(TEMP_PREFIX)
+    assert cache.stats()["disk_bytes"] == len(b"payload2")
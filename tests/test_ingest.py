@@ -0,0 +1,231 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import etl
+import ingest
+import loader
+from cube import DIMENSIONS, load_cube
+from ingest import apply_delta, diff, load_row_hashes
+from loader import compact, export_dataset, load_dataset, read_artifact, store_dataset, with_sentinels
+from partitions import map_partitions, related_partitions
+from related import stable_keys
+from synth import generate
+from test_etl import raw_export
+
+
+def artifacts(dataset):
+    cube = load_cube(dataset)
+    related = related_partitions(dataset).frame
+    return {
+        "frame": dataset.frame.sort_values("eventid"),
+        "cube": cube.cells.sort_values([dim for dim in DIMENSIONS if dim in cube.cells.columns]),
+        "groups": cube.groups.sort_values("gname"),
+        "map": map_partitions(dataset).frame,
+        # An incremental ingest keeps the keys of untouched groups, so compare groups by their members
+        "related": related.assign(event_key=stable_keys(related["eventid"], related["event_key"])),
+    }
+
+
+def assert_same_artifacts(left, right):
+    left, right = artifacts(left), artifacts(right)
+    for name in left:
+        pd.testing.assert_frame_equal(left[name].reset_index(drop=True), right[name].reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False, obj=name)
+
+
+def groups(dataset):
+    related = related_partitions(dataset).frame
+    return {key: frozenset(members) for key, members in related.groupby("event_key")["eventid"]}
+
+
+def with_bridge(frame):
+    """
+    `frame` with one event listing an event of two different chains, which neither lists back: the only link
+    between the two groups. Returns the frame and the eventids of the bridge and of the two linked events
+    """
+    frame = frame.copy()
+    chained = frame[frame["related"] != "Unknown"]
+    first, second = chained["eventid"].iloc[0], chained["eventid"].iloc[-1]
+    bridge = frame.index[frame["related"] == "Unknown"][0]
+    frame.loc[bridge, "related"] = f"{first}, {second}"
+    return frame, frame.loc[bridge, "eventid"], first, second
+
+
+def make_release(frame, bridge):
+    """
+    The next release of `frame`: deleted events (the bridge and others in the middle of related chains), updated
+    events (measures, partition moves, a link joining two chains) and inserted events (some referring to existing
+    ones)
+    """
+    rng = np.random.default_rng(1)
+    frame = with_sentinels(frame).reset_index(drop=True)
+    in_chain = np.flatnonzero((frame["related"] != "Unknown").to_numpy() & (frame["eventid"] != bridge).to_numpy())
+    alone = np.flatnonzero((frame["related"] == "Unknown").to_numpy())
+
+    deleted = np.concatenate([np.flatnonzero((frame["eventid"] == bridge).to_numpy()),
+                              rng.choice(in_chain, 15, replace=False), rng.choice(alone, 15, replace=False)])
+    release = frame.drop(index=deleted)
+    kept_chain = release.index[release["related"] != "Unknown"]
+    kept_alone = release.index[release["related"] == "Unknown"]
+
+    updated = rng.choice(kept_alone, 10, replace=False)
+    release.loc[updated, "nkill"] = release.loc[updated, "nkill"] + 1
+    release.loc[updated[:4], "country"] = "Nepal"
+    joined, other = kept_chain[len(kept_chain) // 3], kept_chain[2 * len(kept_chain) // 3]
+    release.loc[joined, "related"] = release.loc[joined, "related"] + ", " + str(release.loc[other, "eventid"])
+
+    inserted = with_sentinels(generate(40, seed=1))
+    inserted["eventid"] = frame["eventid"].max() + 1 + np.arange(len(inserted))
+    inserted.loc[:4, "related"] = release.loc[kept_chain[10:15], "eventid"].astype(str).to_numpy()
+    return compact(pd.concat([release, inserted[release.columns]], ignore_index=True))
+
+
+def group_of(dataset, eventid):
+    related = related_partitions(dataset).frame
+    return related.loc[related["eventid"] == eventid, "event_key"].item()
+
+
+@pytest.fixture
+def current(tmp_path):
+    path = tmp_path / "current" / "combined_data.csv"
+    path.parent.mkdir()
+    frame, bridge, first, second = with_bridge(generate(3000))
+    dataset = store_dataset(frame, str(path), "A")
+    artifacts(dataset)
+    load_row_hashes(dataset)
+    assert group_of(dataset, first) == group_of(dataset, second)
+    return dataset, bridge, first, second
+
+
+def test_incremental_ingest_matches_full_rebuild(current, tmp_path):
+    current, bridge, first, second = current
+    release = make_release(current.frame, bridge)[current.frame.columns]
+    delta = diff(load_row_hashes(current), release)
+    assert (len(delta.inserted), len(delta.updated), len(delta.deleted)) == (40, 11, 31)
+
+    before = groups(current)
+    apply_delta(current, release, delta, "B")
+    loader.clear_cache()
+    incremental = load_dataset(current.source)
+
+    full_path = tmp_path / "full" / "combined_data.csv"
+    full_path.parent.mkdir()
+    store_dataset(release, str(full_path), "B")
+    loader.clear_cache()
+    assert_same_artifacts(incremental, load_dataset(str(full_path)))
+
+    # Deleting the bridge split its group
+    assert group_of(incremental, first) != group_of(incremental, second)
+    # Groups the delta did not touch keep their key
+    after = groups(incremental)
+    unchanged = [key for key, members in before.items() if members in set(after.values())]
+    assert len(unchanged) > len(before) // 2
+    assert all(after.get(key) == before[key] for key in unchanged)
+
+
+def test_small_delta_work_is_proportional_to_delta(current, monkeypatch):
+    current = current[0]
+    csv = open(current.source, "rb").read()
+    release = with_sentinels(current.frame).reset_index(drop=True)
+    release.loc[:1, "nkill"] = release.loc[:1, "nkill"] + 1
+    release = compact(release.drop(index=[5]))[current.frame.columns]
+    delta = diff(load_row_hashes(current), release)
+    assert len(delta) == 3
+
+    rows = []
+
+    def counted(fn):
+        def wrapper(frame, *args, **kwargs):
+            rows.append(len(frame))
+            return fn(frame, *args, **kwargs)
+        return wrapper
+
+    for name in ["build_cube", "build_group_counts", "build_map_frame", "group_related", "row_hashes"]:
+        monkeypatch.setattr(ingest, name, counted(getattr(ingest, name)))
+
+    def rewrite(*args, **kwargs):
+        raise AssertionError("the ingest path should not rewrite or rehash the dataset")
+
+    monkeypatch.setattr(loader, "file_hash", rewrite)
+    monkeypatch.setattr(loader, "with_sentinels", rewrite)
+    updated = apply_delta(current, release, delta, "B")
+
+    assert rows and max(rows) <= 10
+    assert open(current.source, "rb").read() == csv
+    assert len(updated.frame) == len(current.frame) - 1
+    assert load_dataset(current.source) is updated
+    assert read_artifact(updated, "map") is map_partitions(updated).frame
+
+
+def read_manifest_segments(source):
+    return loader.read_manifest(source)["dataset"]["segments"]
+
+
+def test_export_keeps_version_and_artifacts(current, tmp_path):
+    current, bridge = current[:2]
+    release = make_release(current.frame, bridge)[current.frame.columns]
+    updated = apply_delta(current, release, diff(load_row_hashes(current), release), "B")
+    segments = read_manifest_segments(current.source)
+    assert len(segments) == 1
+
+    export_dataset(current.source)
+    assert read_manifest_segments(current.source) == []
+    assert not any(segments[0] in name for name in os.listdir(os.path.dirname(current.source)))
+    loader.clear_cache()
+    exported = load_dataset(current.source)
+    assert exported.version == updated.version and exported.release == "B"
+    assert read_artifact(exported, "map_related") is not None
+    pd.testing.assert_frame_equal(exported.frame.sort_values("eventid").reset_index(drop=True),
+                                  compact(release).sort_values("eventid").reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+
+
+def write_export(tmp_path, raw, name):
+    source = tmp_path / (name + ".csv")
+    raw.to_csv(source, index=False, encoding="latin-1")
+    return str(source)
+
+
+def test_ingest_end_to_end(tmp_path):
+    ids = 201001010000 + np.arange(30)
+    raw = raw_export(
+        eventid=ids,
+        country_txt=["India", "Pakistan", "Nepal"] * 10,
+        iyear=[2010] * 15 + [2011] * 15,
+        nkill=np.arange(30) % 4,
+        related=[f"{ids[1]}, {ids[2]}", None, None, f"{ids[4]}", None] + [None] * 25,
+    )
+    tables = tmp_path / "tables"
+    etl.run(write_export(tmp_path, raw, "release_a"), str(tables))
+    path = tmp_path / "current" / "combined_data.csv"
+    path.parent.mkdir()
+    current = store_dataset(etl.combine(str(tables)), str(path), "A")
+    artifacts(current)
+
+    release = raw.drop(index=[4, 9]).copy()
+    release.loc[6, "nkill"] = 9
+    release.loc[7, "country_txt"] = "India"
+    inserted = raw_export(eventid=ids[-1] + 1 + np.arange(3), related=[f"{ids[3]}", None, f"{ids[0]}"])
+    release = pd.concat([release, inserted], ignore_index=True)
+    source = write_export(tmp_path, release, "release_b")
+
+    delta = ingest.ingest(source, str(path))
+    assert (len(delta.inserted), len(delta.updated), len(delta.deleted)) == (3, 2, 2)
+    assert load_dataset(str(path)).release == "release_b.csv"
+
+    full_tables = tmp_path / "full_tables"
+    etl.run(source, str(full_tables))
+    full_path = tmp_path / "full" / "combined_data.csv"
+    full_path.parent.mkdir()
+    store_dataset(etl.combine(str(full_tables)), str(full_path), "B")
+    loader.clear_cache()
+    assert_same_artifacts(load_dataset(str(path)), load_dataset(str(full_path)))
+    assert len(ingest.ingest(source, str(path))) == 0
+
+
+def test_unchanged_release_has_empty_delta(current):
+    dataset = current[0]
+    assert len(diff(load_row_hashes(dataset), dataset.frame)) == 0
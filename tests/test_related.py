@@ -0,0 +1,44 @@
+import pandas as pd
+
+from related import group_related
+
+
+def groups(frame):
+    """
+    The groups found by group_related() as a set of frozensets of eventids
+    """
+    grouped = group_related(frame)
+    return {frozenset(ids) for ids in grouped.groupby("event_key")["eventid"].apply(list)}
+
+
+def test_asymmetric_links():
+    # 2 lists 1 and 4 lists 3, but neither is listed back; only events listing related attacks are grouped
+    frame = pd.DataFrame({"eventid": [1, 2, 3, 4, 5],
+                          "related": ["Unknown", "1", None, "3", "Unknown"]})
+    result = group_related(frame)
+    assert list(result["eventid"]) == [2, 4]
+    assert groups(frame) == {frozenset([2]), frozenset([4])}
+
+
+def test_asymmetric_links_join_groups():
+    frame = pd.DataFrame({"eventid": [10, 11, 12, 13],
+                          "related": ["11", "10", "11", "99"]})
+    assert groups(frame) == {frozenset([10, 11, 12]), frozenset([13])}
+
+
+def test_separators():
+    frame = pd.DataFrame({"eventid": [1, 2, 3, 4, 5, 6],
+                          "related": ["2, 3", "1,3", "1 , 2", "5, and 6", "4,6", "4"]})
+    assert groups(frame) == {frozenset([1, 2, 3]), frozenset([4, 5, 6])}
+
+
+def test_links_through_events_outside_the_frame():
+    # 1 and 2 both refer to 100, which is not in the frame
+    frame = pd.DataFrame({"eventid": [1, 2, 3], "related": ["100", "100, ", "200"]})
+    assert groups(frame) == {frozenset([1, 2]), frozenset([3])}
+
+
+def test_keys_follow_smallest_eventid():
+    frame = pd.DataFrame({"eventid": [30, 10, 20], "related": ["99", "20", "10"]})
+    result = group_related(frame).set_index("eventid")["event_key"]
+    assert result.to_dict() == {30: 1, 10: 0, 20: 0}
@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import pytest
+
+from loader import load_dataset, with_sentinels
+from search import TEXT_FIELDS, parse, search, tokenize
+
+
+@pytest.fixture
+def dataset(data_path):
+    return load_dataset(data_path)
+
+
+def test_parse():
+    assert parse("taliban police") == [(False, [(None, ["taliban"], False)]), (False, [(None, ["police"], False)])]
+    assert parse("gname:lashkar* OR gname:jaish* -police") == [
+        (False, [("gname", ["lashkar"], True), ("gname", ["jaish"], True)]),
+        (True, [(None, ["police"], False)]),
+    ]
+    assert parse("al-qaida") == [(False, [(None, ["al", "qaida"], False)])]
+    # A leading OR, an OR before a negation and words without tokens are ignored
+    assert parse("OR a OR -b ...") == [(False, [(None, ["a"], False)]), (True, [(None, ["b"], False)])]
+
+
+def scan(frame, text):
+    """
+    The rows matching `text`, by a regular expression scan over the text columns
+    """
+    values = {field: with_sentinels(frame[[field]])[field].astype(str).str.lower()
+              for field in TEXT_FIELDS if field in frame.columns}
+    mask = np.ones(len(frame), dtype=bool)
+    for negated, alternatives in parse(text):
+        matched = np.zeros(len(frame), dtype=bool)
+        for field, tokens, prefix in alternatives:
+            word = np.ones(len(frame), dtype=bool)
+            for i, token in enumerate(tokens):
+                end = "" if prefix and i == len(tokens) - 1 else "(?![0-9a-z])"
+                pattern = "(?<![0-9a-z])" + re.escape(token) + end
+                word &= np.logical_or.reduce([values[name].str.contains(pattern).to_numpy()
+                                              for name in ([field] if field else values)])
+            matched |= word
+        mask &= ~matched if negated else matched
+    return frame["eventid"].to_numpy()[mask]
+
+
+@pytest.mark.parametrize("text", [
+    "group", "group 1", "gname:group 1", "gname:group OR city:afg", "-unknown", "city:pak* -gname:group",
+    "explosives 4", "province:india* OR province:afghanistan* -city:1", "organization 27*", "nothing-at-all",
+])
+def test_search_matches_scan(dataset, text):
+    result = search(dataset, text, limit=len(dataset.frame))
+    assert result.total == len(result.hits)
+    np.testing.assert_array_equal(result.hits["eventid"].to_numpy(), scan(dataset.frame, text))
+
+
+def test_facets(dataset):
+    frame = dataset.frame
+    result = search(dataset, "city:afg", limit=len(frame), country="Afghanistan", iyear=[2010, 2011])
+    expected = frame[frame["eventid"].isin(scan(frame, "city:afg")) & (frame["country"] == "Afghanistan")
+                     & frame["iyear"].isin([2010, 2011])]
+    assert result.total == len(expected)
+    counts = result.facets["iyear"].set_index("iyear")["count"].to_dict()
+    assert counts == expected["iyear"].value_counts().to_dict()
+
+
+def test_unknown_facet_is_rejected(dataset):
+    with pytest.raises(ValueError):
+        search(dataset, "group", weapon="Firearms")
+
+
+def test_tokenize():
+    assert tokenize("Tehrik-i-Taliban Pakistan (TTP)") == ["tehrik", "i", "taliban", "pakistan", "ttp"]
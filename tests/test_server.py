@@ -0,0 +1,83 @@
+import http.client
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from server import QueryServer
+
+
+@pytest.fixture
+def server(data_path):
+    server = QueryServer(("127.0.0.1", 0), data_path, workers=2, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(server, path, headers=None, connection=None):
+    connection = connection or http.client.HTTPConnection(*server.server_address, timeout=5)
+    connection.request("GET", path, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, response.getheader("ETag"), response.read()
+
+
+def test_idle_connections_do_not_hold_workers(server):
+    # More idle clients than workers, as left behind by clients pooling their connections
+    idle = [socket.create_connection(server.server_address) for _ in range(4)]
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            statuses = list(pool.map(lambda i: get(server, f"/queries/top_groups?n={i % 5 + 1}")[0], range(32)))
+        assert statuses == [200] * 32
+    finally:
+        for sock in idle:
+            sock.close()
+
+
+def test_keep_alive_connection_serves_several_requests(server):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    for _ in range(3):
+        assert get(server, "/health", connection=connection)[0] == 200
+    connection.close()
+
+
+def test_pipelined_requests_are_answered(server):
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\n\r\nGET /queries HTTP/1.1\r\nHost: x\r\n\r\n")
+        received = b""
+        while received.count(b"HTTP/1.1 200") < 2:
+            chunk = sock.recv(65536)
+            assert chunk
+            received += chunk
+
+
+def test_server_close_does_not_wait_for_idle_clients(data_path):
+    server = QueryServer(("127.0.0.1", 0), data_path, workers=1, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    idle = socket.create_connection(server.server_address)
+    assert get(server, "/health")[0] == 200
+    server.shutdown()
+    closing = threading.Thread(target=server.server_close)
+    closing.start()
+    closing.join(5)
+    idle.close()
+    assert not closing.is_alive()
+
+
+def test_etag_gives_not_modified(server):
+    status, etag, _ = get(server, "/queries/top_groups?n=3")
+    assert status == 200
+    assert get(server, "/queries/top_groups?n=3", {"If-None-Match": etag})[0] == 304
+    assert get(server, "/queries/top_groups?n=4", {"If-None-Match": etag})[0] == 200
+
+
+@pytest.mark.parametrize("path", ["/queries/top_groups?n=-1", "/queries/top_groups?n=0",
+                                  "/queries/incident_points?country=India&year=2001&max_points=0",
+                                  "/queries/top_groups?x=1", "/queries/entity_counts?entity=zzz"])
+def test_invalid_parameters_are_rejected(server, path):
+    assert get(server, path)[0] == 400
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from loader import load_dataset
+from partitions import map_partitions, related_partitions
+from queries import IncidentPoints, parse_query
+from spatial import GridIndex
+
+
+def test_grid_index_matches_brute_force():
+    rng = np.random.default_rng(0)
+    latitude = rng.uniform(-60, 60, 5000)
+    longitude = rng.uniform(-170, 170, 5000)
+    index = GridIndex(latitude, longitude, cell_deg=2.5)
+    for _ in range(200):
+        lat_min, lat_max = np.sort(rng.uniform(-70, 70, 2))
+        lon_min, lon_max = np.sort(rng.uniform(-180, 180, 2))
+        expected = np.flatnonzero((latitude >= lat_min) & (latitude <= lat_max)
+                                  & (longitude >= lon_min) & (longitude <= lon_max))
+        np.testing.assert_array_equal(index.query(lat_min, lat_max, lon_min, lon_max), expected)
+
+
+@pytest.mark.parametrize("related", [False, True])
+def test_incident_points_in_bbox(data_path, related):
+    dataset = load_dataset(data_path)
+    frame = (related_partitions if related else map_partitions)(dataset).frame
+    lat, lon = frame["latitude"].astype(float), frame["longitude"].astype(float)
+    lat_min, lat_max = lat.quantile([0.2, 0.6])
+    lon_min, lon_max = lon.quantile([0.1, 0.7])
+    inside = frame[(lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)]
+    assert len(inside)
+
+    query = IncidentPoints(related=related, max_points=len(frame), lat_min=lat_min, lat_max=lat_max,
+                           lon_min=lon_min, lon_max=lon_max)
+    assert len(query.run(dataset)) == len(inside)
+
+    country, year = inside["country"].iloc[0], int(inside["iyear"].iloc[0])
+    in_partition = inside[(inside["country"] == country) & (inside["iyear"] == year)]
+    query = IncidentPoints(country=country, year=year, related=related, max_points=len(frame), lat_min=lat_min,
+                           lat_max=lat_max, lon_min=lon_min, lon_max=lon_max)
+    np.testing.assert_array_equal(query.frame(dataset)["eventid"].to_numpy(),
+                                  np.sort(in_partition["eventid"].to_numpy()))
+
+
+def test_bbox_parameters():
+    query = parse_query("incident_points", {"lat_min": "30", "lat_max": "35.5", "lon_min": "65", "lon_max": "75"})
+    assert query.bbox() == (30.0, 35.5, 65.0, 75.0)
+    with pytest.raises(ValueError):
+        parse_query("incident_points", {"lat_min": "30", "lat_max": "35"})
+    with pytest.raises(ValueError):
+        IncidentPoints(lat_min=35, lat_max=30, lon_min=65, lon_max=75)
+
+
+@pytest.mark.parametrize("max_points", [1, 3, 5])
+def test_incident_points_bounded(data_path, max_points):
+    dataset = load_dataset(data_path)
+    partitions = map_partitions(dataset)
+    (country, year), (start, stop) = max(partitions.offsets.items(), key=lambda item: item[1][1] - item[1][0])
+    assert stop - start > 5
+
+    rows = IncidentPoints(country=country, year=int(year), max_points=max_points).run(dataset)
+    assert 0 < len(rows) <= max_points
+    assert sum(row.incidents for row in rows) == stop - start